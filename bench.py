@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Micro-benchmarks for the stroke, alignment and rule hot paths.
+
+Runs on a fixed corpus, with pronunciations from a fixed table instead of
+espeak, and prints the results as JSON::
+
+    python bench.py --save bench_baseline.json
+    python bench.py --compare bench_baseline.json
+"""
+
+from typing import Any, Callable, Dict, List, MutableMapping, NamedTuple, Optional, Tuple
+import argparse
+import contextlib
+import functools
+import io
+import json
+import sys
+import time
+import tracemalloc
+
+from cache import TieredCache
+from stroke import S, normalise_stroke, compact_tokens, tokenize_phonemes, tokenize_phonemes_many
+import ipa
+import stroke
+import transform
+
+# stroke => translation; includes every entry that the rules expect
+CORPUS: Dict[str, str] = {
+    "PWAR/OE": "borrow",
+    "PW*EUPB": "been",
+    "TH/AOEF": "this eve",
+    "TH": "this",
+    "TPR": "from",
+    "TPR-S": "{^s from}",
+    "TPR-T": "from the",
+    "TPR-Z": "{^s} from",
+    "KOPL/-BG/TPR": "coming from",
+    "-R": "are",
+    "-S": "{^s}",
+    "HRAR/KWR-T": "laureate",
+    "HRAR/KWR-TS": "laureates",
+    "HRAR/KWRAEUT": "laureate",
+    "HRAR/KWRAEUT/-D": "laureated",
+    "HRAR/KWRAEUT/-G": "laureating",
+    "HRAR/KWRAEUTS": "laureates",
+    "AEUR/AEURT": "aerator",
+    "AEUR/AEURTS": "aerators",
+    "AEUR/KAEURT": "{^aricator}",
+    "AEUR/KAEURTS": "{^aricators}",
+    "PREUFB/AEUR/KAEURT": "prevaricator",
+    "PREUFB/AEUR/KAEURTS": "prevaricators",
+    "TKAOEUFB/AEUR/KAEURT": "divaricator",
+    "TKAOEUFB/AEUR/KAEURTS": "divaricators",
+    "TPH/TAEUR/TKPWAEURT": "interrogator",
+    "TPH/TAEUR/TKPWAEURTS": "interrogators",
+    "TPHAEUR/AEURT": "narrator",
+    "TPHAEUR/AEURTS": "narrators",
+    "HRAEURG": "{laryng^}",
+    "A/TKREPB/A*L": "adrenal",
+    "PHAPBLG/EUBG": "magic",
+    "AD/SREPB/KHUR": "adventure",
+    "PHAOEU/TPHUS": "minus",
+    "AB/S*EUPBT": "absinthe",
+    "ABG/SEL/RAPBT": "accelerant",
+    "PWAR/TKPWEUPB": "bargain",
+    "EL/TPAPBT": "elephant",
+    "KAP/TAL": "capital",
+    "APB/PHAL": "animal",
+    "E/SREPB/KHUL": "eventual",
+    "SRAULT": "volt",
+    "AUFS": "office",
+    "AUB/PWHRAOEUPBLG": "oblige",
+    "OFS": "office",
+    "KAUPL": "{com^}",
+    "KOPL": "come",
+    "PHAEUR": "marry",
+    "PHAR": "mare",
+    "PAEUR/TKEU": "parody",
+    "PAR/TKEU": "pardy",
+    "SKAEUR": "scary",
+    "SKAR": "scar",
+    "AULT": "{alt^}",
+    "KWAULT": "quality",
+    "1": "1",
+    "1*": "one",
+    "2": "2",
+    "TWO": "2",
+    "TWO*": "two",
+    "TWOPBT": "20th",
+    "TWO*PBT": "twentieth",
+    "KWA*EPBGTS": "eighteenths",
+    "TH-T": "the thing",
+    "-T": "the",
+    "PH-PL": "{.} ",
+    "*PLT": "{^ment}",
+    "A/*PLT": "ament",
+    "THEUPBG": "think",
+    "THEU": "think",
+    "PHAPBLG": "{magic^}",
+    "TPROPL": "from",
+    "SAO*PL": "somewhere",
+    "PHOD/ERPB": "modern",
+    "KAR/ROT": "carrot",
+    "PHOE/TOR": "motor",
+    "HREPL/OPB": "lemon",
+    "PAPB/EUBG": "panic",
+    "PHET/AL": "metal",
+    "PHET/EL": "mettle",
+    "PHOR/AL": "moral",
+    "SOL/EUD": "solid",
+    "TOP/EUBG": "topic",
+    "AT/OPL": "atom",
+    "KOT/TOPB": "cotton",
+    "PAR/ROT": "parrot",
+    "PHER/EUT": "merit",
+    "TOPB/EUBG": "tonic",
+    "KOPL/EUBG": "comic",
+    "SROPL/EUT": "vomit",
+    "PROPL/EUS": "promise",
+    "TKOL/HRAR": "dollar",
+    "KOL/HRAR": "collar",
+    "PHOE/HRAR": "molar",
+    "TPHOPL/TPHAL": "nominal",
+    "KAUPL/EUBG": "comics",
+    "PAUL/EUS": "police",
+    "HRAUT/REU": "lottery",
+    "KAEUR/ROT": "carrots",
+    "PHAEUR/EUT": "merits",
+    "SPAEUR/OE": "sparrow",
+    "TKPWAEUR/KWREPB": "garden",
+    "SKAEUR/KWREU": "scarey",
+    "TPHU/PHER/EUBG": "numeric",
+    "TKOL/HRAR/-S": "dollars",
+    "SAOER/OE": "zero",
+    "KOT/TOPB/-S": "cottons",
+    "SRAEUR/KWROUS": "various",
+    "HRAT/RAL": "lateral",
+    "PHER/EUT/-S": "merits",
+    "PAR/ROT/-D": "parroted",
+    "SOR/REU": "sorry",
+}
+
+# translation => pronunciation, standing in for espeak
+STUB_IPA: Dict[str, str] = {
+    "modern": "mˈɒdən",
+    "carrot": "kˈaɹət",
+    "motor": "mˈəʊtə",
+    "lemon": "lˈɛmən",
+    "panic": "pˈanɪk",
+    "metal": "mˈɛtəl",
+    "mettle": "mˈɛtəl",
+    "moral": "mˈɒɹəl",
+    "solid": "sˈɒlɪd",
+    "topic": "tˈɒpɪk",
+    "atom": "ˈatəm",
+    "cotton": "kˈɒtən",
+    "parrot": "pˈaɹət",
+    "merit": "mˈɛɹɪt",
+    "tonic": "tˈɒnɪk",
+    "comic": "kˈɒmɪk",
+    "vomit": "vˈɒmɪt",
+    "promise": "pɹˈɒmɪs",
+    "dollar": "dˈɒlə",
+    "collar": "kˈɒlə",
+    "molar": "mˈəʊlə",
+    "nominal": "nˈɒmɪnəl",
+    "comics": "kˈɒmɪks",
+    "police": "pəlˈiːs",
+    "lottery": "lˈɒtəɹi",
+    "carrots": "kˈaɹəts",
+    "merits": "mˈɛɹɪts",
+    "sparrow": "spˈaɹəʊ",
+    "garden": "ɡˈɑːdən",
+    "scarey": "skˈeəɹi",
+    "numeric": "njuːmˈɛɹɪk",
+    "adrenal": "ɐdɹˈiːnəl",
+    "magic": "mˈadʒɪk",
+    "minus": "mˈaɪnəs",
+    "adventure": "ɐdvˈɛntʃə",
+    "absinthe": "ˈabsɪnθ",
+    "accelerant": "ɐksˈɛləɹənt",
+    "bargain": "bˈɑːɡɪn",
+    "elephant": "ˈɛlɪfənt",
+    "capital": "kˈapɪtəl",
+    "animal": "ˈanɪməl",
+    "eventual": "ɪvˈɛntʃuːəl",
+    "volt": "vˈəʊlt",
+    "office": "ˈɒfɪs",
+    "oblige": "əblˈaɪdʒ",
+    "marry": "mˈaɹi",
+    "parody": "pˈaɹədi",
+    "scary": "skˈeəɹi",
+}
+
+_NAIVE_IPA = {
+    "a": "a", "e": "ɛ", "i": "ɪ", "o": "ɒ", "u": "ʌ",
+    "c": "k", "g": "ɡ", "j": "dʒ", "q": "k", "r": "ɹ", "x": "ks", "y": "j",
+}
+
+
+def stub_ipa(word: str) -> str:
+    """The pronunciation of ``word`` from :data:`STUB_IPA`, or failing that a
+    naive one, stressed on the first vowel.
+
+    >>> stub_ipa("magic"), stub_ipa("scar")
+    ('mˈadʒɪk', 'skˈaɹ')
+    """
+    if word in STUB_IPA:
+        return STUB_IPA[word]
+
+    pronunciation = ""
+    stressed = False
+    for c in word.lower():
+        if not ("a" <= c <= "z"):
+            continue
+        if c in "aeiou":
+            pronunciation += ("ə" if stressed else "ˈ" + _NAIVE_IPA[c])
+            stressed = True
+        else:
+            pronunciation += _NAIVE_IPA.get(c, c)
+    return pronunciation
+
+
+def stub_cache() -> TieredCache:
+    """An in-memory cache holding the pronunciation of every translation in
+    :data:`CORPUS`, so that nothing is looked up with espeak.
+    """
+    cache = TieredCache(dict())
+    for tran in CORPUS.values():
+        cache.pronunciations[tran] = stub_ipa(tran)
+    return cache
+
+
+# (brief, translation, pronunciation) of every vowel-dropping candidate
+VOP_CORPUS = [
+    (brief, tran, stub_ipa(tran))
+    for brief, tran in CORPUS.items()
+    if transform.is_vop_candidate(brief, tran)
+]
+
+# S does not parse number strokes
+STROKES = [
+    part
+    for brief in CORPUS
+    for part in brief.split("/")
+    if not any(c.isdigit() for c in part)
+]
+
+
+class Benchmark(NamedTuple):
+    """Times ``op(setup())``; ``setup`` is not timed."""
+
+    name: str
+    op: Callable[[Any], Any]
+    setup: Callable[[], Any] = lambda: None
+
+
+def _parse_strokes(strokes: List[str]) -> None:
+    for s in strokes:
+        S(s)
+
+
+def _stroke_arithmetic(strokes: List[S]) -> None:
+    vowels = S("AOEU")
+    star = S("*")
+    for s in strokes:
+        reduced = s - (s & vowels)
+        if star not in reduced:
+            reduced + star
+        reduced < s
+
+
+def _uncached_strokes() -> List[str]:
+    stroke._PARSED.clear()
+    return STROKES
+
+
+def _run_rule(rule: Callable, args: Tuple[Dict[str, str], TieredCache]) -> MutableMapping[str, str]:
+    dictionary, cache = args
+    return transform.run_rule(rule, dictionary, cache=cache)
+
+
+def benchmarks() -> List[Benchmark]:
+    rules = [
+        transform.rule_AULT_ALT,
+        transform.rule_AU_O,
+        transform.rule_AEUR_to_AR_ER,
+        transform.rule_been,
+        transform.rule_punctuation,
+        transform.rule_number_star,
+        transform.rule_TH_the,
+        transform.rule_FR_for,
+        transform.rule_PLT_consistency,
+        transform.rule_vop_shortvowels,
+    ]
+
+    return [
+        Benchmark("S_parse", _parse_strokes, _uncached_strokes),
+        Benchmark("S_arithmetic", _stroke_arithmetic, lambda: [S(s) for s in STROKES]),
+        Benchmark(
+            "normalise_stroke",
+            lambda strokes: [normalise_stroke(s) for s in strokes],
+            lambda: STROKES,
+        ),
+        Benchmark(
+            "ipa_tokenize",
+            lambda corpus: [ipa.tokenize(p) for _, _, p in corpus],
+            lambda: VOP_CORPUS,
+        ),
+        Benchmark(
+            "tokenize_phonemes",
+            lambda corpus: [tokenize_phonemes(p, brief) for brief, _, p in corpus],
+            lambda: VOP_CORPUS,
+        ),
+        Benchmark(
+            "tokenize_phonemes_many",
+            lambda corpus: list(tokenize_phonemes_many((p, brief) for brief, _, p in corpus)),
+            lambda: VOP_CORPUS,
+        ),
+        Benchmark(
+            "compact_tokens",
+            lambda aligned: [list(compact_tokens(tokens)) for tokens in aligned],
+            lambda: [stroke._align(p, brief) for brief, _, p in VOP_CORPUS],
+        ),
+        Benchmark(
+            "apply_vop",
+            lambda cache: [
+                transform.apply_vop(brief, tran, cache) for brief, tran, _ in VOP_CORPUS
+            ],
+            stub_cache,
+        ),
+    ] + [
+        Benchmark(
+            rule.__name__,
+            functools.partial(_run_rule, rule),
+            lambda: (dict(CORPUS), stub_cache()),
+        )
+        for rule in rules
+    ]
+
+
+def measure(benchmark: Benchmark, repeat: int = 50, warmup: int = 3) -> Dict[str, float]:
+    """Runs ``benchmark`` ``repeat`` times, returning its throughput, its
+    median and 99th percentile latency, and the peak memory it allocates.
+    """
+    for _ in range(warmup):
+        benchmark.op(benchmark.setup())
+
+    samples = []
+    for _ in range(repeat):
+        arg = benchmark.setup()
+        start = time.perf_counter()
+        benchmark.op(arg)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+
+    arg = benchmark.setup()
+    tracemalloc.start()
+    try:
+        benchmark.op(arg)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        # the median is less noisy than the mean
+        "ops_per_sec": 1 / samples[len(samples) // 2],
+        "p50_us": samples[len(samples) // 2] * 1e6,
+        "p99_us": samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e6,
+        "peak_alloc_bytes": peak,
+    }
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    tolerance: float = 0.1,
+) -> List[str]:
+    """Lists the benchmarks that got slower, or allocate more, than
+    ``baseline`` by more than ``tolerance``.
+
+    >>> compare({"a": {"ops_per_sec": 80, "peak_alloc_bytes": 10}},
+    ...         {"a": {"ops_per_sec": 100, "peak_alloc_bytes": 10}})
+    ['a: 80 ops/sec, was 100']
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        if result["ops_per_sec"] < old["ops_per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {result['ops_per_sec']:.0f} ops/sec, was {old['ops_per_sec']:.0f}"
+            )
+        if result["peak_alloc_bytes"] > old["peak_alloc_bytes"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: {result['peak_alloc_bytes']:.0f} bytes, "
+                f"was {old['peak_alloc_bytes']:.0f}"
+            )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--only", help="only run benchmarks whose name contains this")
+    parser.add_argument("--save", help="save the results as a baseline to this file")
+    parser.add_argument("--compare", help="compare the results against this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    results = dict()
+    # the rules report every change they make
+    with contextlib.redirect_stdout(io.StringIO()):
+        for benchmark in benchmarks():
+            if args.only and args.only not in benchmark.name:
+                continue
+            results[benchmark.name] = measure(benchmark, repeat=args.repeat)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    print(json.dumps(results, indent=2, sort_keys=True))
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("Regression:", regression, file=sys.stderr)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
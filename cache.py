@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""A tiered cache: a bounded in-memory LRU in front of a persistent dbm store.
+"""
+
+from typing import Counter, Dict, Iterator, MutableMapping, Optional, Tuple
+import collections
+import dbm
+
+
+class Namespace(MutableMapping[str, str]):
+    """A view of one namespace of a :class:`TieredCache`.
+
+    >>> cache = TieredCache(dict())
+    >>> cache.pronunciations["magic"] = "mˈadʒɪk"
+    >>> cache.pronunciations["magic"]
+    'mˈadʒɪk'
+    >>> "magic" in cache.results
+    False
+    """
+
+    def __init__(self, cache: "TieredCache", name: str):
+        self.cache = cache
+        self.name = name
+
+    def __getitem__(self, key: str) -> str:
+        value = self.cache.get(self.name, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: str) -> None:
+        self.cache.put(self.name, key, value)
+
+    def __delitem__(self, key: str) -> None:
+        self.cache.delete(self.name, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return self.cache.keys(self.name)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+class TieredCache:
+    """Caches strings in separate namespaces, in front of the persistent
+    ``store`` (a dbm-like mapping of bytes to bytes).
+
+    Recently used values are kept decoded in memory, up to ``maxsize`` of
+    them.  Writes are buffered and written back to the store in batches of
+    ``write_batch``, and when the cache is flushed or closed.
+
+    >>> store = dict()
+    >>> cache = TieredCache(store, maxsize=1)
+    >>> cache.pronunciations["a"] = "ə"
+    >>> cache.pronunciations["b"] = "bˈiː"
+    >>> cache.pronunciations.get("a"), cache.pronunciations.get("c")
+    ('ə', None)
+    >>> sorted(cache.stats.items())
+    [('evictions', 2), ('hits', 1), ('misses', 1)]
+    >>> store
+    {}
+    >>> cache.flush()
+    >>> sorted(store)
+    [b'ipa:a', b'ipa:b']
+    """
+
+    def __init__(self, store, *, maxsize: int = 1 << 16, write_batch: int = 1024):
+        self.store = store
+        self.maxsize = maxsize
+        self.write_batch = write_batch
+        self.stats: Counter[str] = collections.Counter()
+
+        self._lru: "collections.OrderedDict[Tuple[str, str], str]" = (
+            collections.OrderedDict()
+        )
+        self._dirty: Dict[bytes, Optional[bytes]] = dict()
+
+        self.pronunciations = Namespace(self, "ipa")
+        self.results = Namespace(self, "vop")
+
+    @classmethod
+    def open(cls, path: str = "ipa_cache", **kwargs) -> "TieredCache":
+        return cls(dbm.open(path, "c"), **kwargs)
+
+    def __enter__(self) -> "TieredCache":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        try:
+            value = self._lru[namespace, key]
+        except KeyError:
+            pass
+        else:
+            self._lru.move_to_end((namespace, key))
+            self.stats["hits"] += 1
+            return value
+
+        raw = self._read(self._store_key(namespace, key))
+        if raw is None:
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["hits"] += 1
+        value = raw.decode("utf-8")
+        self._remember(namespace, key, value)
+        return value
+
+    def put(self, namespace: str, key: str, value: str) -> None:
+        self._remember(namespace, key, value)
+        self._dirty[self._store_key(namespace, key)] = value.encode("utf-8")
+        if len(self._dirty) >= self.write_batch:
+            self.flush()
+
+    def delete(self, namespace: str, key: str) -> None:
+        if self.get(namespace, key) is None:
+            raise KeyError(key)
+        self._lru.pop((namespace, key), None)
+        self._dirty[self._store_key(namespace, key)] = None
+
+    def keys(self, namespace: str) -> Iterator[str]:
+        self.flush()
+        prefix = self._store_key(namespace, "")
+        for raw in self.store.keys():
+            if raw.startswith(prefix):
+                yield raw[len(prefix) :].decode("utf-8")
+
+    def flush(self) -> None:
+        """Writes all buffered values back to the store."""
+        for raw_key, raw in self._dirty.items():
+            if raw is None:
+                try:
+                    del self.store[raw_key]
+                except KeyError:
+                    pass
+            else:
+                self.store[raw_key] = raw
+        self._dirty.clear()
+
+    def close(self) -> None:
+        self.flush()
+        if hasattr(self.store, "close"):
+            self.store.close()
+
+    def _store_key(self, namespace: str, key: str) -> bytes:
+        return f"{namespace}:{key}".encode("utf-8")
+
+    def _read(self, raw_key: bytes) -> Optional[bytes]:
+        if raw_key in self._dirty:
+            return self._dirty[raw_key]
+        try:
+            return self.store[raw_key]
+        except KeyError:
+            return None
+
+    def _remember(self, namespace: str, key: str, value: str) -> None:
+        self._lru[namespace, key] = value
+        self._lru.move_to_end((namespace, key))
+        while len(self._lru) > self.maxsize:
+            self._lru.popitem(last=False)
+            self.stats["evictions"] += 1
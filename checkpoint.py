@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Binary checkpoints of the dictionary after each stage of a run.
+"""
+
+from pathlib import Path
+from typing import Callable, Iterable, List, Mapping, Optional, Tuple
+import hashlib
+import inspect
+import pickle
+
+CHECKPOINT_VERSION = 1
+
+
+def rule_digest(rule: Callable) -> str:
+    """A digest of the source of ``rule`` itself, not of what it calls: see
+    the ``code`` of :func:`chain_digests`.
+    """
+    return hashlib.sha1(inspect.getsource(rule).encode("utf-8")).hexdigest()
+
+
+def file_digest(path: Path, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha1()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def chain_digests(source: str, rules: Iterable[Callable], code: str = "") -> List[str]:
+    """The digest of the dictionary after each of ``rules``, given the digest
+    of the ``source`` dictionary it started from.
+
+    ``code`` is a digest of everything the rules use besides their own source,
+    such as the tables and functions they call (see
+    :func:`manifest.source_digest`), so that a change to any of it makes every
+    checkpoint stale.
+
+    >>> a, b = chain_digests("source", [save, load])
+    >>> chain_digests("source", [save]) == [a]
+    True
+    >>> chain_digests("source", [load, load])[1] == b
+    False
+    >>> chain_digests("source", [save, load], code="edited") == [a, b]
+    False
+    """
+    digest = hashlib.sha1(str(CHECKPOINT_VERSION).encode("utf-8"))
+    digest.update(f"{source}\0{code}".encode("utf-8"))
+
+    digests = []
+    for rule in rules:
+        digest.update(f"\0{rule.__name__}\0{rule_digest(rule)}".encode("utf-8"))
+        digests.append(digest.hexdigest())
+    return digests
+
+
+def save(path: Path, dictionary: Mapping[str, str], chain: str) -> None:
+    with path.open("wb") as f:
+        pickle.dump((chain, dictionary), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load(path: Path, chain: str) -> Optional[Mapping[str, str]]:
+    """The dictionary checkpointed at ``path``, if it is there and was made by
+    the same chain of rules.
+    """
+    try:
+        with path.open("rb") as f:
+            saved_chain, dictionary = pickle.load(f)
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        return None
+    if saved_chain != chain:
+        return None
+    return dictionary
+
+
+def checkpoint_path(stage: int) -> Path:
+    return Path(f"stage_{stage}.pickle")
+
+
+def resume(chain: List[str], stage: int) -> Tuple[int, Optional[Mapping[str, str]]]:
+    """Finds the latest valid checkpoint to run ``stage`` from.
+
+    Returns the first stage still to run, and the dictionary to run it on, or
+    ``None`` if the run has to start from the source dictionary.
+    """
+    for ix in reversed(range(min(stage, len(chain)))):
+        dictionary = load(checkpoint_path(ix), chain[ix])
+        if dictionary is not None:
+            return ix + 1, dictionary
+    return 0, None
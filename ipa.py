@@ -2,8 +2,20 @@
 # -*- coding: utf-8 -*-
 
 
-from typing import Generator, List, NamedTuple
+from typing import Any, Dict, Generator, Generic, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple, TypeVar
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import abc
+import atexit
+import functools
+import json
+import os
+import select
+import shutil
 import subprocess
+import time
+
+import report
 
 
 def str_tails(xs: str) -> Generator[str, None, None]:
@@ -406,6 +418,67 @@ all_symbols = vowels + consonants
 schwa_like = ["ə", "ɚ", "ɛ", "ĕ", "e", "ɪ", "ĭ", "ɐ", "u"]
 
 
+def _compile_tokens() -> Set[str]:
+    tokens = set(stressor)
+    for stress in [""] + stressor:
+        for symbol in all_symbols:
+            for modifier in ("", extensor, palatal):
+                tokens.add(stress + symbol + modifier)
+    return tokens
+
+
+_VOWELS = frozenset(vowels)
+_CONSONANTS = frozenset(consonants)
+
+# every string that is_ipa_token accepts
+_IPA_TOKENS = _compile_tokens()
+
+
+V = TypeVar("V")
+
+
+class Trie(Generic[V]):
+    """A trie of strings, each with the values added for it, which finds every
+    string that starts at a given point of a text in one walk.
+
+    >>> trie: Trie[int] = Trie()
+    >>> for ix, key in enumerate(["a", "aɪ", "aɪə", "b"]):
+    ...     trie.add(key, ix)
+    >>> list(trie.prefixes("xaɪəb", 1))
+    [(2, [0]), (3, [1]), (4, [2])]
+    """
+
+    # never a character of a key, so it can't clash with a child
+    _END = ""
+
+    def __init__(self, items: Iterable[Tuple[str, V]] = ()):
+        self._root: Dict[str, Any] = dict()
+        for key, value in items:
+            self.add(key, value)
+
+    def add(self, key: str, value: V) -> None:
+        node = self._root
+        for char in key:
+            node = node.setdefault(char, dict())
+        node.setdefault(self._END, list()).append(value)
+
+    def prefixes(self, text: str, start: int = 0) -> Iterator[Tuple[int, List[V]]]:
+        """The end of each string in the trie that ``text`` has at ``start``,
+        shortest first, with its values.
+        """
+        node = self._root
+        for end in range(start, len(text)):
+            child: Optional[Dict[str, Any]] = node.get(text[end])
+            if child is None:
+                return
+            node = child
+            if self._END in node:
+                yield end + 1, node[self._END]
+
+
+_TOKEN_TRIE: Trie[None] = Trie((token, None) for token in _IPA_TOKENS | {" "})
+
+
 def is_ipa_token(tok: str) -> bool:
     """
     >>> is_ipa_token("d")
@@ -423,17 +496,7 @@ def is_ipa_token(tok: str) -> bool:
     >>> is_ipa_token("nʲ")
     True
     """
-    if any(tok == s for s in stressor):
-        # just the stressor, short circuit
-        return True
-
-    if any(tok.startswith(s) for s in stressor):
-        tok = tok[1:]
-
-    if tok.endswith(extensor) or tok.endswith(palatal):
-        tok = tok[:-1]
-
-    return tok in all_symbols
+    return tok in _IPA_TOKENS
 
 
 def is_short_unstressed_syllable(sound: str) -> bool:
@@ -456,17 +519,16 @@ def is_short_unstressed_syllable(sound: str) -> bool:
     >>> is_short_unstressed_syllable("tʃuːəl")  # evenTUAL
     True
     """
-    vowels_in_sound = filter(lambda c: c in vowels, sound)
-
-    return (
-        all(v in schwa_like for v in vowels_in_sound)
-        and not any(x in sound for x in stressor)
-    )
+    analysis = analyse(sound)
+    return analysis.schwa_only and not analysis.stressed
 
 
 def tokenize(pronunciation: str) -> List[str]:
     """Accumulate with state machine
 
+    Each token is extended one character at a time for as long as it is still
+    a valid token, walking a trie of all tokens.
+
     >>> tokenize("dˈɪkʃənəɹɪ")
     ['d', 'ˈɪ', 'k', 'ʃ', 'ə', 'n', 'ə', 'ɹ', 'ɪ']
     >>> tokenize("bˈɑːɡɪn")
@@ -474,45 +536,545 @@ def tokenize(pronunciation: str) -> List[str]:
     >>> tokenize("kwˈɑːsɑ̃")
     ['k', 'w', 'ˈɑː', 's', 'ɑ̃']
     """
+    return _scan(pronunciation, strict=True)
+
+
+def _scan(pronunciation: str, *, strict: bool) -> List[str]:
+    """Splits ``pronunciation`` into tokens.  Characters that don't start any
+    token are an error if ``strict``, and tokens of their own otherwise.
+    """
     tokens: List[str] = []
 
     index = 0
+    length = len(pronunciation)
 
-    while index < len(pronunciation):
-        token = None
+    while index < length:
+        end = index
 
-        for cand in str_tails(pronunciation[index:]):
-            if is_ipa_token(cand) or cand == " ":
-                token = cand
-            else:
+        # extended for as long as every prefix is a token
+        for stop, _ in _TOKEN_TRIE.prefixes(pronunciation, index):
+            if stop != end + 1:
                 break
+            end = stop
 
-        assert token is not None, f"Encountered {cand} in {pronunciation}"
+        if end == index:
+            assert not strict, f"Encountered {pronunciation[index]} in {pronunciation}"
+            end += 1
 
-        tokens.append(token)
-        index += len(token)
+        tokens.append(pronunciation[index:end])
+        index = end
 
     return tokens
 
 
-def word_to_ipa(word: str, *, voice: str = "en-gb-x-rp", cache=None) -> str:
+def tokenize_many(pronunciations: Iterable[str]) -> List[List[str]]:
+    """Tokenizes each of ``pronunciations``, only once per distinct one.
+
+    >>> tokenize_many(["bˈɑːɡɪn", "kwˈɑːsɑ̃", "bˈɑːɡɪn"])
+    [['b', 'ˈɑː', 'ɡ', 'ɪ', 'n'], ['k', 'w', 'ˈɑː', 's', 'ɑ̃'], ['b', 'ˈɑː', 'ɡ', 'ɪ', 'n']]
     """
-    >>> word_to_ipa("sacrifice")
-    'sˈækɹɪfˌaɪs'
+    done: Dict[str, List[str]] = dict()
+    results = list()
+    for pronunciation in pronunciations:
+        try:
+            tokens = done[pronunciation]
+        except KeyError:
+            tokens = done[pronunciation] = tokenize(pronunciation)
+        results.append(list(tokens))
+    return results
+
+
+class Analysis(NamedTuple):
+    """What the rules need to know about a sound, see :func:`analyse`."""
+
+    tokens: Tuple[str, ...]
+    # has a primary or secondary stress mark
+    stressed: bool
+    # the vowels, without stress or length marks
+    vowels: Tuple[str, ...]
+    # all of the vowels (if any) are schwa-like
+    schwa_only: bool
+    # vowels with a length mark
+    long_vowels: int
+    # tokens that are plain consonants (no stress or modifiers)
+    consonants: int
+    # index of the token that starts each syllable
+    syllables: Tuple[int, ...]
+
+
+def _base(token: str) -> str:
+    """Strips the stress mark and length or palatal modifier from a token."""
+    if token[:1] in stressor:
+        token = token[1:]
+    if token.endswith(extensor) or token.endswith(palatal):
+        token = token[:-1]
+    return token
+
+
+@functools.lru_cache(maxsize=None)
+def analyse(sound: str) -> Analysis:
+    """Tokenizes ``sound`` once and collects its features.  Unknown symbols are
+    kept as tokens of their own, and ignored.
+
+    Syllables start at each vowel (a run of vowels is one syllable), or at
+    the consonant just before it.
+
+    >>> a = analyse("dˈɪkʃənəɹɪ")
+    >>> a.stressed, a.vowels, a.schwa_only, a.consonants
+    (True, ('ɪ', 'ə', 'ə', 'ɪ'), True, 5)
+    >>> ["".join(a.tokens[i:j]) for i, j in zip(a.syllables, a.syllables[1:] + (None,))]
+    ['dˈɪk', 'ʃə', 'nə', 'ɹɪ']
+    >>> analyse("nɔɪd").schwa_only, analyse("ɹuːm").long_vowels
+    (False, 1)
     """
-    if cache is not None:
+    tokens = tuple(_scan(sound, strict=False))
+    bases = [_base(token) for token in tokens]
+    is_vowel = [base in _VOWELS for base in bases]
+
+    syllables: List[int] = list()
+    for ix, vowel in enumerate(is_vowel):
+        if vowel and not (ix > 0 and is_vowel[ix - 1]):
+            start = ix - 1 if ix > 0 and bases[ix - 1] in _CONSONANTS else ix
+            syllables.append(start if syllables else 0)
+
+    vowels_in_sound = tuple(base for base, vowel in zip(bases, is_vowel) if vowel)
+
+    return Analysis(
+        tokens=tokens,
+        stressed=any(token[:1] in stressor for token in tokens),
+        vowels=vowels_in_sound,
+        schwa_only=all(v in schwa_like for v in vowels_in_sound),
+        long_vowels=sum(
+            1 for token, vowel in zip(tokens, is_vowel) if vowel and token.endswith(extensor)
+        ),
+        consonants=sum(1 for token in tokens if token in _CONSONANTS),
+        syllables=tuple(syllables),
+    )
+
+
+class _EspeakFailure(Exception):
+    """The espeak process died or stopped answering."""
+
+
+class _EspeakTimeout(_EspeakFailure):
+    """The espeak process took too long to answer."""
+
+
+class Espeak:
+    """A long-lived ``espeak`` process, fed one word per line over stdin.
+
+    Given no text and no ``--stdin``, espeak speaks each line of its input as
+    soon as it is read.  After each word a sentinel word is sent, so that every
+    word's output can be matched back to it even if espeak prints several
+    lines (or nothing) for it.  Words that espeak rejects are remembered and
+    resolve to ``""``.
+    """
+
+    SENTINEL = "zqxjkzqxjk"
+
+    def __init__(
+        self, voice: str = "en-gb-x-rp", *, timeout: float = 5.0, batch_size: int = 32
+    ):
+        self.voice = voice
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.rejected: Set[str] = set()
+        self.spawns = 0
+
+        self._process: Optional[subprocess.Popen] = None
+        self._buffer = b""
+        self._sentinel_ipa = ""
+
+    def start(self) -> None:
+        """Starts the process, raising :class:`OSError` if espeak cannot be
+        run.
+        """
+        if shutil.which("espeak") is None:
+            raise FileNotFoundError("espeak is not installed")
+
+        command = ["espeak", "-v", self.voice, "-qx", "-b1", "--ipa"]
+        if shutil.which("stdbuf"):
+            # espeak flushes after each line, but make sure of it
+            command = ["stdbuf", "-oL"] + command
+
+        self._process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=0,
+        )
+        self._buffer = b""
+        self.spawns += 1
+        report.count("espeak_spawns")
+
+        try:
+            self._send([self.SENTINEL])
+            self._sentinel_ipa = self._readline(time.monotonic() + self.timeout)
+        except _EspeakFailure as e:
+            self.close()
+            raise OSError(f"espeak failed to start: {e}") from e
+
+    def close(self) -> None:
+        if self._process is None:
+            return
+
+        process, self._process = self._process, None
         try:
-            return cache[word].decode("utf-8")
-        except:
+            process.kill()
+            process.wait(timeout=self.timeout)
+        except (OSError, subprocess.TimeoutExpired):
             pass
+        for pipe in (process.stdin, process.stdout):
+            if pipe is not None:
+                pipe.close()
+
+    def lookup(self, word: str) -> str:
+        return self.lookup_many([word])[word]
+
+    def lookup_many(self, words: Iterable[str]) -> Dict[str, str]:
+        """Pronounce ``words``, pipelining them through the process in batches
+        of ``batch_size``.
+
+        A word is retried once after the process crashes on it, and left out
+        of the results if it crashes it again or times out, so that it is
+        tried again next time.  Words that espeak has no pronunciation for are
+        rejected, resolving to ``""``.
+        """
+        words = list(dict.fromkeys(words))
+        results: Dict[str, str] = dict()
+
+        pending = list()
+        for word in words:
+            if word in self.rejected or not word.strip():
+                results[word] = ""
+            else:
+                pending.append(word)
+
+        index = 0
+        failures = 0
+        while index < len(pending):
+            batch = pending[index : index + self.batch_size]
+            try:
+                if self._process is None:
+                    self.start()
+                self._send(
+                    [line for word in batch for line in (word, self.SENTINEL)]
+                )
+                for word in batch:
+                    results[word] = self._read_result(
+                        time.monotonic() + self.timeout
+                    )
+                    index += 1
+                    failures = 0
+            except _EspeakFailure as e:
+                self.close()
+                failures += 1
+                if isinstance(e, _EspeakTimeout) or failures > 1:
+                    # skip the word, without rejecting it
+                    index += 1
+                    failures = 0
+
+        for word, ipa_str in results.items():
+            if not ipa_str:
+                self.rejected.add(word)
+
+        return {word: results[word] for word in words if word in results}
+
+    def _send(self, lines: List[str]) -> None:
+        assert self._process is not None and self._process.stdin is not None
+        # one word per line: espeak must not see embedded line breaks
+        data = "".join(
+            line.replace("\r", " ").replace("\n", " ") + "\n" for line in lines
+        )
+        try:
+            self._process.stdin.write(data.encode("utf-8"))
+            self._process.stdin.flush()
+        except OSError as e:
+            raise _EspeakFailure("espeak stopped reading input") from e
+
+    def _read_result(self, deadline: float) -> str:
+        lines: List[str] = list()
+        while True:
+            line = self._readline(deadline)
+            if line == self._sentinel_ipa:
+                return " ".join(line for line in lines if line)
+            lines.append(line)
+
+    def _readline(self, deadline: float) -> str:
+        assert self._process is not None and self._process.stdout is not None
+        fd = self._process.stdout.fileno()
+
+        while b"\n" not in self._buffer:
+            remaining = deadline - time.monotonic()
+            ready, _, _ = select.select([fd], [], [], max(remaining, 0))
+            if not ready:
+                raise _EspeakTimeout("espeak timed out")
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                raise _EspeakFailure("espeak exited")
+            self._buffer += chunk
+
+        line, _, self._buffer = self._buffer.partition(b"\n")
+        return line.decode("utf-8").strip()
+
+
+_ESPEAK: Dict[str, Espeak] = dict()
+
+
+def espeak(voice: str = "en-gb-x-rp") -> Espeak:
+    """The shared espeak process for ``voice``, started on first use."""
+    try:
+        return _ESPEAK[voice]
+    except KeyError:
+        worker = _ESPEAK[voice] = Espeak(voice)
+        return worker
+
+
+@atexit.register
+def _close_espeak() -> None:
+    for worker in _ESPEAK.values():
+        worker.close()
+
+
+def _lookup_parallel(words: List[str], *, voice: str, jobs: int) -> Dict[str, str]:
+    shards = [shard for shard in (words[i::jobs] for i in range(jobs)) if shard]
+    workers = [Espeak(voice) for _ in shards]
+
+    resolved: Dict[str, str] = dict()
+    try:
+        with ThreadPoolExecutor(max_workers=len(workers)) as pool:
+            for shard_results in pool.map(Espeak.lookup_many, workers, shards):
+                resolved.update(shard_results)
+    finally:
+        for worker in workers:
+            worker.close()
+            espeak(voice).rejected |= worker.rejected
+
+    return resolved
+
+
+class Backend(abc.ABC):
+    """A source of pronunciations."""
+
+    @abc.abstractmethod
+    def lookup_many(self, words: List[str], *, jobs: int = 1) -> Dict[str, str]:
+        """Pronounces as many of ``words`` as possible, leaving out the ones it
+        does not know.
+        """
+
+    def known(self, words: List[str]) -> Dict[str, str]:
+        """The pronunciations of ``words`` that the backend holds itself, which
+        take precedence over any cache since they are always up to date.
+        """
+        return dict()
+
+
+class EspeakBackend(Backend):
+    """Pronounces every word with espeak, as ``""`` if espeak rejects it.
+
+    Words that espeak timed out or crashed on are left out.  With
+    ``missing_ok``, so are all words if espeak is not installed, instead of
+    raising :class:`FileNotFoundError`.
+    """
 
-    ipa_str = (
-        subprocess.check_output(["espeak", "-v", voice, "-qx", "-b1", "--ipa", word])
-        .decode("utf-8")
-        .strip()
-    )
+    def __init__(self, voice: str = "en-gb-x-rp", *, missing_ok: bool = False):
+        self.voice = voice
+        self.missing_ok = missing_ok
+
+    def lookup_many(self, words: List[str], *, jobs: int = 1) -> Dict[str, str]:
+        if self.missing_ok and shutil.which("espeak") is None:
+            return dict()
+        if jobs > 1 and len(words) > 1:
+            return _lookup_parallel(words, voice=self.voice, jobs=jobs)
+        return espeak(self.voice).lookup_many(words)
+
+
+class TableBackend(Backend):
+    """Pronounces the words in a precomputed ``table``.
+
+    >>> TableBackend({"magic": "mˈadʒɪk"}).lookup_many(["magic", "minus"])
+    {'magic': 'mˈadʒɪk'}
+    """
+
+    def __init__(self, table: Dict[str, str]):
+        self.table = table
+
+    @classmethod
+    def from_file(cls, path: Path) -> "TableBackend":
+        """Loads a JSON object of words to pronunciations, or any other file
+        with one tab-separated word and pronunciation per line.
+        """
+        if path.suffix == ".json":
+            return cls(json.loads(path.read_text(encoding="utf-8")))
+
+        table = dict()
+        with path.open(encoding="utf-8") as f:
+            for line in f:
+                word, sep, ipa_str = line.rstrip("\n").partition("\t")
+                if sep:
+                    table[word] = ipa_str
+        return cls(table)
+
+    def lookup_many(self, words: List[str], *, jobs: int = 1) -> Dict[str, str]:
+        return {word: self.table[word] for word in words if word in self.table}
+
+    def known(self, words: List[str]) -> Dict[str, str]:
+        return self.lookup_many(words)
+
+
+class ChainBackend(Backend):
+    """Asks each of ``backends`` in turn for the words that the ones before
+    it did not know.
+
+    >>> chain = ChainBackend(TableBackend({"a": "ə"}), TableBackend({"a": "ˈeɪ", "b": "bˈiː"}))
+    >>> chain.lookup_many(["a", "b", "c"])
+    {'a': 'ə', 'b': 'bˈiː'}
+    """
+
+    def __init__(self, *backends: Backend):
+        self.backends = backends
+
+    def lookup_many(self, words: List[str], *, jobs: int = 1) -> Dict[str, str]:
+        results: Dict[str, str] = dict()
+        for backend in self.backends:
+            missing = [word for word in words if word not in results]
+            if not missing:
+                break
+            results.update(backend.lookup_many(missing, jobs=jobs))
+        return {word: results[word] for word in words if word in results}
+
+    def known(self, words: List[str]) -> Dict[str, str]:
+        results: Dict[str, str] = dict()
+        for backend in reversed(self.backends):
+            results.update(backend.known(words))
+        return results
+
+
+_BACKEND: Optional[Backend] = None
+
+
+def set_backend(backend: Optional[Backend]) -> None:
+    """Makes ``backend`` the default source of pronunciations, instead of
+    espeak.
+    """
+    global _BACKEND
+    _BACKEND = backend
 
+
+def current_backend() -> Optional[Backend]:
+    """The backend set by :func:`set_backend`, if any."""
+    return _BACKEND
+
+
+def _backend(backend: Optional[Backend], voice: str) -> Backend:
+    if backend is not None:
+        return backend
+    if _BACKEND is not None:
+        return _BACKEND
+    return EspeakBackend(voice)
+
+
+def _cached(cache, word: str) -> Optional[str]:
+    """Looks up ``word`` in ``cache``, which maps to either bytes (a raw dbm) or
+    strings.
+    """
+    if cache is None:
+        report.count("pronunciation_cache_misses")
+        return None
+
+    try:
+        value = cache[word]
+    except KeyError:
+        report.count("pronunciation_cache_misses")
+        return None
+
+    report.count("pronunciation_cache_hits")
+
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return value
+
+
+def word_to_ipa(
+    word: str,
+    *,
+    voice: str = "en-gb-x-rp",
+    cache=None,
+    backend: Optional[Backend] = None,
+) -> str:
+    """Pronounces ``word`` with ``backend``, or the default backend, which is
+    espeak unless :func:`set_backend` says otherwise.
+
+    A pronunciation the backend holds itself (see :meth:`Backend.known`) is
+    used even if ``cache`` has another, and is not cached.
+
+    >>> word_to_ipa("sacrifice")
+    'sˈækɹɪfˌaɪs'
+    >>> word_to_ipa("magic", backend=TableBackend({"magic": "mˈadʒɪk"}))
+    'mˈadʒɪk'
+    """
+    chosen = _backend(backend, voice)
+    known = chosen.known([word])
+    if word in known:
+        return known[word]
+
+    cached = _cached(cache, word)
+    if cached is not None:
+        return cached
+
+    resolved = chosen.lookup_many([word])
+    if word not in resolved:
+        # not cached, so that it is looked up again next time
+        return ""
+
+    ipa_str = resolved[word]
     if cache is not None:
         cache[word] = ipa_str
 
     return ipa_str
+
+
+def word_to_ipa_many(
+    words: Iterable[str],
+    *,
+    voice: str = "en-gb-x-rp",
+    cache=None,
+    jobs: int = 1,
+    backend: Optional[Backend] = None,
+) -> Dict[str, str]:
+    """Like :func:`word_to_ipa`, but sends all uncached words to the backend
+    in one batch.
+
+    With ``jobs`` > 1 espeak splits the uncached words across that many
+    processes, which run in parallel.
+
+    >>> word_to_ipa_many(["sacrifice"])
+    {'sacrifice': 'sˈækɹɪfˌaɪs'}
+    """
+    words = list(dict.fromkeys(words))
+    chosen = _backend(backend, voice)
+    results = chosen.known(words)
+    missing = list()
+
+    for word in words:
+        if word in results:
+            continue
+        cached = _cached(cache, word)
+        if cached is not None:
+            results[word] = cached
+        else:
+            missing.append(word)
+
+    resolved = chosen.lookup_many(missing, jobs=jobs)
+
+    for word in missing:
+        if word not in resolved:
+            # not cached, so that it is looked up again next time
+            results[word] = ""
+            continue
+        ipa_str = results[word] = resolved[word]
+        if cache is not None:
+            cache[word] = ipa_str
+
+    return {word: results[word] for word in words}
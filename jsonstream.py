@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Reads and writes Plover JSON dictionaries one entry at a time.
+"""
+
+from pathlib import Path
+from typing import Generator, Iterable, Iterator, List, TextIO, Tuple
+import heapq
+import itertools
+import json
+import operator
+import tempfile
+
+Entry = Tuple[str, str]
+
+_WHITESPACE = " \t\n\r"
+
+
+class _Incomplete(Exception):
+    pass
+
+
+def _skip(buf: str, pos: int) -> int:
+    while pos < len(buf) and buf[pos] in _WHITESPACE:
+        pos += 1
+    if pos == len(buf):
+        raise _Incomplete
+    return pos
+
+
+def _string(buf: str, pos: int) -> Tuple[str, int]:
+    if buf[pos] != '"':
+        raise json.JSONDecodeError("Expecting string", buf, pos)
+    try:
+        return json.decoder.scanstring(buf, pos + 1)  # type: ignore
+    except json.JSONDecodeError:
+        raise _Incomplete
+
+
+def _entry(buf: str, pos: int) -> Tuple[str, str, int, bool]:
+    """Parses one ``"stroke": "translation"`` pair, and the comma or brace
+    after it.
+    """
+    stroke, pos = _string(buf, _skip(buf, pos))
+    pos = _skip(buf, pos)
+    if buf[pos] != ":":
+        raise json.JSONDecodeError("Expecting ':' delimiter", buf, pos)
+    tran, pos = _string(buf, _skip(buf, pos + 1))
+    pos = _skip(buf, pos)
+    if buf[pos] not in ",}":
+        raise json.JSONDecodeError("Expecting ',' delimiter", buf, pos)
+    return stroke, tran, pos + 1, buf[pos] == "}"
+
+
+def iter_entries(f: TextIO, chunk_size: int = 1 << 16) -> Generator[Entry, None, None]:
+    """Yields the entries of the JSON dictionary in ``f``, reading it
+    ``chunk_size`` characters at a time.
+
+    >>> import io
+    >>> list(iter_entries(io.StringIO('{"KAT": "cat",\\n"TKOG": "dog"}'), chunk_size=4))
+    [('KAT', 'cat'), ('TKOG', 'dog')]
+    >>> list(iter_entries(io.StringIO(' { } ')))
+    []
+    """
+    buf = ""
+    pos = 0
+    eof = False
+
+    def more() -> None:
+        nonlocal buf, pos, eof
+        chunk = f.read(chunk_size)
+        if not chunk:
+            if eof:
+                raise json.JSONDecodeError("Unexpected end of dictionary", buf, pos)
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    while True:
+        try:
+            pos = _skip(buf, pos)
+            break
+        except _Incomplete:
+            more()
+    if buf[pos] != "{":
+        raise json.JSONDecodeError("Expecting '{'", buf, pos)
+    pos += 1
+
+    while True:
+        try:
+            pos = _skip(buf, pos)
+            break
+        except _Incomplete:
+            more()
+    if buf[pos] == "}":
+        return
+
+    done = False
+    while not done:
+        try:
+            stroke, tran, pos, done = _entry(buf, pos)
+        except _Incomplete:
+            more()
+            continue
+        yield stroke, tran
+
+
+def read_entries(path: Path, chunk_size: int = 1 << 16) -> Generator[Entry, None, None]:
+    with path.open(encoding="utf-8") as f:
+        yield from iter_entries(f, chunk_size)
+
+
+class JSONDictionary:
+    """A dictionary file whose :meth:`items` are read afresh each time they
+    are iterated over, so that it never has to be held in memory.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def items(self) -> Iterator[Entry]:
+        return read_entries(self.path)
+
+
+def _runs(entries: Iterable[Entry], run_size: int, tmp: Path) -> List[Path]:
+    runs: List[Path] = []
+    entries = iter(entries)
+    while True:
+        run = sorted(itertools.islice(entries, run_size), key=operator.itemgetter(0))
+        if not run:
+            return runs
+        path = tmp / f"run_{len(runs)}.jsonl"
+        with path.open("w", encoding="utf-8") as f:
+            for entry in run:
+                f.write(json.dumps(entry, ensure_ascii=False))
+                f.write("\n")
+        runs.append(path)
+
+
+def _read_run(path: Path) -> Generator[Entry, None, None]:
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            stroke, tran = json.loads(line)
+            yield stroke, tran
+
+
+def write_sorted(path: Path, entries: Iterable[Entry], run_size: int = 1 << 16) -> None:
+    """Writes ``entries`` to ``path`` exactly as
+    ``json.dumps(dict(entries), indent=0, ensure_ascii=False, sort_keys=True)``
+    would, sorting them in runs of ``run_size`` that are merged from disk.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        runs = _runs(entries, run_size, Path(tmp))
+        merged = heapq.merge(*map(_read_run, runs), key=operator.itemgetter(0))
+
+        with path.open("w", encoding="utf-8") as f:
+            first = True
+            # the merge is stable, so the last of equal strokes is the latest
+            for stroke, group in itertools.groupby(merged, key=operator.itemgetter(0)):
+                for _, tran in group:
+                    pass
+                f.write("{\n" if first else ",\n")
+                f.write(json.dumps(stroke, ensure_ascii=False))
+                f.write(": ")
+                f.write(json.dumps(tran, ensure_ascii=False))
+                first = False
+            f.write("{}" if first else "\n}")
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""A record of what each rule produced from which entries, so that a run can
+reuse the work of the previous one.
+"""
+
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import hashlib
+import json
+import pickle
+import re
+
+MANIFEST_VERSION = 3
+
+Entry = Tuple[str, str]
+
+
+def entry_hash(stroke: str, tran: str) -> str:
+    """
+    >>> entry_hash("PHAPBLG/EUBG", "magic") == entry_hash("PHAPBLG/EUBG", "magic")
+    True
+    >>> entry_hash("PHAPBLG/EUBG", "magic") == entry_hash("PHAPBLG", "EUBG/magic")
+    False
+    """
+    return hashlib.sha1(f"{stroke}\0{tran}".encode("utf-8")).hexdigest()[:16]
+
+
+def digest_entries(entries: Iterable[Entry]) -> str:
+    """A digest of ``entries``, in order, since the rules depend on it.
+
+    >>> digest_entries([("A", "a"), ("B", "b")]) == digest_entries([("B", "b"), ("A", "a")])
+    False
+    """
+    digest = hashlib.sha1()
+    for stroke, tran in entries:
+        digest.update(f"{stroke}\0{tran}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def source_digest(paths: Iterable[Path]) -> str:
+    """A digest of the source files that the rules are made of."""
+    digest = hashlib.sha1(str(MANIFEST_VERSION).encode("utf-8"))
+    for path in paths:
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+class EntryOutputs:
+    """What a rule made of each of its input entries, keyed by
+    :func:`entry_hash` and by whatever else the output ``depends_on``, such as
+    a pronunciation, so that it only has to work on the entries that changed.
+
+    Lookups are served from the previous run, and every output is kept for
+    the next one.
+
+    >>> outputs = EntryOutputs()
+    >>> outputs.put("A/EU", "a", "A", depends_on="ə")
+    >>> outputs = EntryOutputs(outputs.current)
+    >>> outputs.get("A/EU", "a", "ə"), outputs.get("A/EU", "a", "eɪ")
+    ('A', None)
+    >>> outputs.put("A/O", "o", "O")
+    >>> sorted(outputs.current.values()), outputs.reused
+    (['A', 'O'], 1)
+    """
+
+    def __init__(self, previous: Optional[Dict[str, Any]] = None):
+        self.previous = previous if previous is not None else dict()
+        self.current: Dict[str, Any] = dict()
+        self.reused = 0
+
+    def get(self, stroke: str, tran: str, depends_on: str = "") -> Optional[Any]:
+        key = self._key(stroke, tran, depends_on)
+        output = self.previous.get(key)
+        if output is not None:
+            self.current[key] = output
+            self.reused += 1
+        return output
+
+    def put(self, stroke: str, tran: str, output: Any, depends_on: str = "") -> None:
+        self.current[self._key(stroke, tran, depends_on)] = output
+
+    def keep_all(self) -> None:
+        """Keeps every output of the previous run, for a stage reused whole."""
+        self.current.update(self.previous)
+
+    def _key(self, stroke: str, tran: str, depends_on: str) -> str:
+        depends = hashlib.sha1(depends_on.encode("utf-8")).hexdigest()[:16]
+        return f"{entry_hash(stroke, tran)}:{depends}"
+
+
+class Manifest:
+    """The hash of each source entry, and for each stage the digest of the
+    entries its rule was applied to along with the entries it produced.
+
+    The manifest lives in ``directory``: ``manifest.json`` holds the digests,
+    and the entries of each stage are kept in a file of their own, read only
+    when the stage can reuse them.  Records are only reused by runs with the same ``version``,
+    i.e. the same rule configuration.  Lookups are served from the loaded
+    manifest, while :meth:`record` builds up the one for this run.
+
+    >>> import tempfile
+    >>> directory = Path(tempfile.mkdtemp())
+    >>> manifest = Manifest.load(directory, "v1")
+    >>> manifest.lookup("0:rule_been", "abc") is None
+    True
+    >>> manifest.record("0:rule_been", "abc", [("PWEUPB", "bin")])
+    >>> manifest.save()
+    >>> Manifest.load(directory, "v1").lookup("0:rule_been", "abc")
+    [('PWEUPB', 'bin')]
+    >>> Manifest.load(directory, "v2").lookup("0:rule_been", "abc") is None
+    True
+    """
+
+    def __init__(self, version: str, directory: Path, previous: Optional[dict] = None):
+        self.version = version
+        if previous is None or previous.get("version") != version:
+            previous = dict(version=version, stages=dict())
+        self.previous = previous
+        self.current: dict = dict(version=version, stages=dict())
+        self.directory = directory
+
+        self.entries: Dict[str, str] = dict()
+        # stage => what the previous run saved for it
+        self._saved: Dict[str, Optional[dict]] = dict()
+
+    @classmethod
+    def load(cls, directory: Path, version: str) -> "Manifest":
+        try:
+            previous = json.loads((directory / "manifest.json").read_text())
+        except (OSError, ValueError):
+            previous = None
+        return cls(version, directory, previous)
+
+    def save(self) -> None:
+        self._dump(Path("entries.pickle"), (self.version, self.entries))
+        (self.directory / "manifest.json").write_text(
+            json.dumps(self.current, ensure_ascii=False)
+        )
+
+    def record_entries(self, entries: Iterable[Entry]) -> int:
+        """Records the hash of each source entry, returning how many of them
+        are new or changed since the previous run.
+        """
+        previous = self._load(Path("entries.pickle"))
+        if previous is None or previous[0] != self.version:
+            previous = (self.version, dict())
+
+        changed = 0
+        for stroke, tran in entries:
+            self.entries[stroke] = entry_hash(stroke, tran)
+            if previous[1].get(stroke) != self.entries[stroke]:
+                changed += 1
+        return changed
+
+    def lookup(self, stage: str, digest: str) -> Optional[List[Entry]]:
+        """The entries produced by ``stage`` from entries with ``digest``, if
+        the previous run recorded them.
+        """
+        record = self.previous["stages"].get(stage)
+        if record is None or record["input"] != digest:
+            return None
+        saved = self._load_stage(stage)
+        if saved is None or saved["input"] != digest:
+            return None
+        return saved["output"]
+
+    def entry_outputs(self, stage: str) -> EntryOutputs:
+        """What the rule of ``stage`` made of each entry in the previous run."""
+        saved = self._load_stage(stage)
+        return EntryOutputs(saved["entries"] if saved is not None else None)
+
+    def _load_stage(self, stage: str) -> Optional[dict]:
+        if stage not in self.previous["stages"]:
+            return None
+        if stage not in self._saved:
+            self._saved[stage] = self._load(self._stage_path(stage))
+        return self._saved[stage]
+
+    def record(
+        self,
+        stage: str,
+        digest: str,
+        output: List[Entry],
+        entry_outputs: Optional[EntryOutputs] = None,
+    ) -> None:
+        self.current["stages"][stage] = dict(input=digest, output=digest_entries(output))
+        self._saved.pop(stage, None)
+        self._dump(
+            self._stage_path(stage),
+            dict(
+                input=digest,
+                output=output,
+                entries=entry_outputs.current if entry_outputs is not None else dict(),
+            ),
+        )
+
+    def _stage_path(self, stage: str) -> Path:
+        return Path("stage_" + re.sub(r"[^\w.-]", "_", stage) + ".pickle")
+
+    def _load(self, name: Path) -> Any:
+        try:
+            with (self.directory / name).open("rb") as f:
+                return pickle.load(f)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+
+    def _dump(self, name: Path, value: Any) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with (self.directory / name).open("wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Counters and timings of a run, reported for each step.
+"""
+
+from pathlib import Path
+from typing import Any, Callable, Counter, Dict, Iterator, List, MutableMapping, Optional, Tuple
+import collections
+import contextlib
+import json
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Unix only
+    resource = None  # type: ignore
+
+_LOCK = threading.Lock()
+
+# incremented wherever the counted thing happens, e.g. "espeak_spawns"
+COUNTERS: Counter[str] = collections.Counter()
+# total seconds spent in each timed function
+TIMES: Dict[str, float] = collections.defaultdict(float)
+
+Snapshot = Tuple[Dict[str, int], Dict[str, float]]
+
+
+def count(name: str, n: int = 1) -> None:
+    with _LOCK:
+        COUNTERS[name] += n
+
+
+def record_call(name: str, seconds: float) -> None:
+    """Counts a call to ``name`` that took ``seconds``."""
+    with _LOCK:
+        COUNTERS[f"{name}_calls"] += 1
+        TIMES[name] += seconds
+
+
+def snapshot() -> Snapshot:
+    with _LOCK:
+        return dict(COUNTERS), dict(TIMES)
+
+
+def since(before: Snapshot) -> Snapshot:
+    """What was counted since ``before``.
+
+    >>> before = snapshot()
+    >>> count("things", 2)
+    >>> since(before)
+    ({'things': 2}, {})
+    """
+    counters, times = snapshot()
+    before_counters, before_times = before
+    return (
+        {
+            k: v - before_counters.get(k, 0)
+            for k, v in counters.items()
+            if v != before_counters.get(k, 0)
+        },
+        {
+            k: v - before_times.get(k, 0)
+            for k, v in times.items()
+            if v != before_times.get(k, 0)
+        },
+    )
+
+
+def merge(delta: Snapshot) -> None:
+    """Adds what another process counted."""
+    with _LOCK:
+        COUNTERS.update(delta[0])
+        for name, seconds in delta[1].items():
+            TIMES[name] += seconds
+
+
+def _cpu_time() -> float:
+    cpu = time.process_time()
+    if resource is not None:
+        # only includes child processes that have exited
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu += children.ru_utime + children.ru_stime
+    return cpu
+
+
+class RunReport:
+    """A report of each step of a run.
+
+    The entries added, removed and modified by each step are what its rule
+    counted as ``entries_added``, ``entries_removed`` and
+    ``entries_modified``; a stroke that a rule renames is counted as one of
+    each of the first two.
+
+    >>> report = RunReport(dictionary="dict.json")
+    >>> result = report.step("drop_all", lambda d: count("entries_removed") or {}, {"A": "a"})
+    >>> record = report.steps[0]
+    >>> record["entries_scanned"], record["entries_removed"], record["conflicts"]
+    (1, 1, 0)
+    """
+
+    def __init__(self, **info: Any):
+        self.info = info
+        self.steps: List[Dict[str, Any]] = list()
+
+    @contextlib.contextmanager
+    def measure(self, name: str) -> Iterator[Dict[str, Any]]:
+        """Records the time taken by, and what was counted during, the body
+        of the ``with`` statement, which may add to the yielded record.
+        """
+        record: Dict[str, Any] = {"step": name}
+        counted = snapshot()
+        wall, cpu = time.perf_counter(), _cpu_time()
+
+        yield record
+
+        wall, cpu = time.perf_counter() - wall, _cpu_time() - cpu
+        counters, times = since(counted)
+
+        hits = counters.get("pronunciation_cache_hits", 0)
+        lookups = hits + counters.get("pronunciation_cache_misses", 0)
+
+        record.update(
+            {
+                "wall_s": wall,
+                "cpu_s": cpu,
+                "conflicts": counters.get("conflicts", 0),
+                "pronunciation_lookups": lookups,
+                "pronunciation_cache_hit_ratio": hits / lookups if lookups else None,
+                "espeak_spawns": counters.get("espeak_spawns", 0),
+                "entries_added": counters.get("entries_added", 0),
+                "entries_removed": counters.get("entries_removed", 0),
+                "entries_modified": counters.get("entries_modified", 0),
+                "entries_reused": counters.get("entries_reused", 0),
+                "tokenize_phonemes_calls": counters.get("tokenize_phonemes_calls", 0),
+                "tokenize_phonemes_s": times.get("tokenize_phonemes", 0.0),
+            }
+        )
+        self.steps.append(record)
+
+    def step(
+        self,
+        name: str,
+        run: Callable[[MutableMapping[str, str]], MutableMapping[str, str]],
+        dictionary: MutableMapping[str, str],
+        scanned: Optional[int] = None,
+    ) -> MutableMapping[str, str]:
+        """Runs ``run`` on ``dictionary`` and records how it went, including
+        how many entries were ``scanned`` to pick it out, if not just those
+        in ``dictionary``, and how many translations more than one stroke
+        produces afterwards.
+        """
+        with self.measure(name) as record:
+            record["entries_scanned"] = len(dictionary) if scanned is None else scanned
+            result = run(dictionary)
+        # kept up to date by a stenodict.StenoDictionary
+        duplicates = getattr(result, "duplicate_count", None)
+        if duplicates is not None:
+            record["duplicate_translations"] = duplicates
+        return result
+
+    def reused(self, name: str) -> None:
+        """Records that the output of step ``name`` was reused."""
+        self.steps.append({"step": name, "reused": True})
+
+    def save(self, path: Path) -> None:
+        path.write_text(
+            json.dumps(dict(self.info, steps=self.steps), indent=2, ensure_ascii=False)
+        )
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""A steno dictionary that also indexes its briefs by translation, and by the
+keys of each of their strokes.
+"""
+
+from typing import Dict, Iterable, Iterator, List, Mapping, MutableMapping, Optional, Set, Tuple, Union
+
+from stroke import S
+
+# position of a stroke in the brief => stroke => briefs with that stroke there
+ChordIndex = List[Dict[str, Set[str]]]
+
+
+class StenoDictionary(MutableMapping[str, str]):
+    """A mapping of strokes to translations, which the rules change in place
+    from one step to the next.
+
+    Entries keep their place in the dictionary order, as in a ``dict``, and
+    :meth:`rename` moves a brief without losing its place.  The first
+    translation-keyed query indexes the strokes of every translation, and the
+    first call to :meth:`candidates` the keys of every brief; from then on
+    every set and delete, and so every swap, keeps those indexes up to date
+    too.
+
+    >>> d = StenoDictionary({"KAT": "cat", "KA*T": "Kat", "KAP": "cap"})
+    >>> d["KA*T"] = "cat"
+    >>> d.strokes_for("cat"), d.strokes_for("Kat"), d.duplicate_count
+    (['KAT', 'KA*T'], [], 1)
+    >>> d["KAT"], d["KAP"] = d["KAP"], d["KAT"]
+    >>> d.strokes_for("cat"), d["KAT"]
+    (['KA*T', 'KAP'], 'cap')
+    >>> del d["KAP"]
+    >>> d.is_duplicate("cat"), d.duplicate_count
+    (False, 0)
+    """
+
+    def __init__(self, entries: Union[Mapping[str, str], Iterable[Tuple[str, str]]] = ()):
+        self._forward: Dict[str, str] = dict()
+        # brief => its place in the dictionary order
+        self._place: Dict[str, int] = dict()
+        self._next = 0
+        # whether a rename left _forward out of order
+        self._moved = False
+
+        # translation => its strokes, in the order they were added; built by
+        # the first translation-keyed query
+        self._reverse: Optional[Dict[str, Dict[str, None]]] = None
+        self._duplicates = 0
+
+        # built by the first call to candidates
+        self._chords: Optional[ChordIndex] = None
+        # stroke => its keys, or None if it is not in steno order
+        self._keys: Dict[str, Optional[int]] = dict()
+
+        if isinstance(entries, Mapping):
+            entries = entries.items()
+        for stroke, tran in entries:
+            self[stroke] = tran
+
+    def __getitem__(self, stroke: str) -> str:
+        return self._forward[stroke]
+
+    def __setitem__(self, stroke: str, tran: str) -> None:
+        old = self._forward.get(stroke)
+        if old == tran:
+            return
+        if old is None:
+            self._place[stroke] = self._next
+            self._next += 1
+            if self._chords is not None:
+                self._index_chords(stroke)
+        elif self._reverse is not None:
+            self._unindex(stroke, old)
+        self._forward[stroke] = tran
+        if self._reverse is not None:
+            self._index(stroke, tran)
+
+    def __delitem__(self, stroke: str) -> None:
+        tran = self._forward.pop(stroke)
+        del self._place[stroke]
+        if self._reverse is not None:
+            self._unindex(stroke, tran)
+        if self._chords is not None:
+            self._unindex_chords(stroke)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._ordered())
+
+    def __len__(self) -> int:
+        return len(self._forward)
+
+    def __contains__(self, stroke: object) -> bool:
+        return stroke in self._forward
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self._ordered()!r})"
+
+    def __reduce__(self):
+        # the indexes are rebuilt on demand rather than pickled
+        return type(self), (list(self.items()),)
+
+    def items(self):  # type: ignore
+        return self._ordered().items()
+
+    def _ordered(self) -> Dict[str, str]:
+        if self._moved:
+            self._forward = {
+                stroke: self._forward[stroke]
+                for stroke in sorted(self._forward, key=self._place.__getitem__)
+            }
+            self._moved = False
+        return self._forward
+
+    def _index(self, stroke: str, tran: str) -> None:
+        assert self._reverse is not None
+        strokes = self._reverse.setdefault(tran, dict())
+        strokes[stroke] = None
+        if len(strokes) == 2:
+            self._duplicates += 1
+
+    def _unindex(self, stroke: str, tran: str) -> None:
+        assert self._reverse is not None
+        strokes = self._reverse[tran]
+        del strokes[stroke]
+        if len(strokes) == 1:
+            self._duplicates -= 1
+        elif not strokes:
+            del self._reverse[tran]
+
+    def _translations(self) -> Dict[str, Dict[str, None]]:
+        if self._reverse is None:
+            self._reverse = dict()
+            for stroke, tran in self._ordered().items():
+                self._index(stroke, tran)
+        return self._reverse
+
+    def _index_chords(self, brief: str) -> None:
+        assert self._chords is not None
+        strokes = brief.split("/")
+        while len(self._chords) < len(strokes):
+            self._chords.append(dict())
+        for at, stroke in zip(self._chords, strokes):
+            at.setdefault(stroke, set()).add(brief)
+
+    def _unindex_chords(self, brief: str) -> None:
+        assert self._chords is not None
+        for position, stroke in enumerate(brief.split("/")):
+            briefs = self._chords[position][stroke]
+            briefs.remove(brief)
+            if not briefs:
+                del self._chords[position][stroke]
+
+    def _keys_of(self, stroke: str) -> Optional[int]:
+        if stroke not in self._keys:
+            try:
+                self._keys[stroke] = S(stroke).mask
+            except AssertionError:
+                self._keys[stroke] = None
+        return self._keys[stroke]
+
+    def rename(self, stroke: str, new_stroke: str) -> None:
+        """Moves the translation of ``stroke`` to ``new_stroke``, in the place
+        of ``stroke``.
+
+        If ``new_stroke`` is already there, the two entries end up as if the
+        dictionary had been built afresh with ``stroke`` renamed: the
+        translation of the later one in the place of the earlier one.
+
+        >>> d = StenoDictionary({"A": "a", "AULT": "alt", "B": "b", "ALT": "old"})
+        >>> d.rename("A", "C")
+        >>> d.rename("AULT", "ALT")
+        >>> d
+        StenoDictionary({'C': 'a', 'ALT': 'old', 'B': 'b'})
+        """
+        if new_stroke == stroke:
+            return
+        place, tran = self._place[stroke], self._forward[stroke]
+        if new_stroke in self._forward:
+            if self._place[new_stroke] > place:
+                tran = self._forward[new_stroke]
+            place = min(place, self._place[new_stroke])
+            del self[new_stroke]
+        del self[stroke]
+        self[new_stroke] = tran
+        self._place[new_stroke] = place
+        self._moved = True
+
+    def candidates(self, *chords: S, start: int = 0) -> List[str]:
+        """The briefs, in dictionary order, that have every key of one of
+        ``chords`` in a single stroke, from the stroke at ``start`` on.
+
+        Each distinct stroke is only parsed once.  Strokes that are not in
+        steno order match any chord, so that the caller's own test decides on
+        their briefs.
+
+        >>> d = StenoDictionary({"PWAUL": "ball", "KAT/HRAUG": "catalogue", "KAT": "cat"})
+        >>> d.candidates(S("AU"))
+        ['PWAUL', 'KAT/HRAUG']
+        >>> d.candidates(S("AU"), start=1)
+        ['KAT/HRAUG']
+        >>> d["A*U/TOE"] = "auto"
+        >>> del d["PWAUL"]
+        >>> d.rename("KAT", "A*U")
+        >>> d.candidates(S("AU"), S("O"))
+        ['KAT/HRAUG', 'A*U', 'A*U/TOE']
+        """
+        if self._chords is None:
+            self._chords = list()
+            for brief in self._forward:
+                self._index_chords(brief)
+
+        masks = [chord.mask for chord in chords]
+        if not all(masks):
+            return list(self)
+
+        found: Set[str] = set()
+        for strokes in self._chords[start:]:
+            for stroke, briefs in strokes.items():
+                keys = self._keys_of(stroke)
+                if keys is None or any(keys & mask == mask for mask in masks):
+                    found.update(briefs)
+
+        if 4 * len(found) > len(self._forward):
+            # cheaper than sorting that many
+            return [brief for brief in self._ordered() if brief in found]
+        return sorted(found, key=self._place.__getitem__)
+
+    def strokes_for(self, tran: str) -> List[str]:
+        """The strokes that produce ``tran``."""
+        return list(self._translations().get(tran, ()))
+
+    def is_duplicate(self, tran: str) -> bool:
+        """Whether more than one stroke produces ``tran``."""
+        return len(self._translations().get(tran, ())) > 1
+
+    @property
+    def duplicate_count(self) -> int:
+        """The number of translations that more than one stroke produces."""
+        self._translations()
+        return self._duplicates
+
+
+def indexed(dictionary: Mapping[str, str]) -> StenoDictionary:
+    """``dictionary`` itself if it is a :class:`StenoDictionary`, so that its
+    order and indexes carry over, or else a copy that is.
+    """
+    if isinstance(dictionary, StenoDictionary):
+        return dictionary
+    return StenoDictionary(dictionary)
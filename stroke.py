@@ -2,15 +2,20 @@
 # -*- coding: utf-8 -*-
 
 
-from typing import Any, Deque, Generator, List, NamedTuple, Set, Tuple
+from pathlib import Path
+from typing import Callable, Deque, Dict, FrozenSet, Generator, Iterable, List, NamedTuple, Optional, Set, Tuple, Union
 import collections
-import copy
+import functools
+import hashlib
 import heapq
 import itertools
+import json
 import logging
 import re
+import time
 
 import ipa
+import report
 
 steno_order = "1S2TK3PW4HR5A0O*EU-6fr7pb7lg8ts9dz"
 
@@ -18,8 +23,31 @@ steno_order = "1S2TK3PW4HR5A0O*EU-6fr7pb7lg8ts9dz"
 _LOG = logging.getLogger(__name__)
 
 
+_KEY_BITS = {key: 1 << steno_order.index(key) for key in steno_order}
+_BIT_KEYS = {bit: key for key, bit in _KEY_BITS.items()}
+_STAR = _KEY_BITS["*"]
+_DASH = _KEY_BITS["-"]
+_IMPLICIT_DASH = sum(_KEY_BITS[k] for k in "AO*EU")
+
+# interning tables: one instance per mask, and the instance for each string
+# that has been parsed before
+_INTERNED: Dict[int, "S"] = dict()
+_PARSED: Dict[str, "S"] = dict()
+_TEXT: Dict["S", str] = dict()
+
+
 class S:
-    def __init__(self, stroke: str):
+    """A single stroke, stored as a bitmask over ``steno_order``.
+
+    Strokes are immutable and interned, so they can be used as dictionary keys
+    and compared by identity.
+    """
+
+    __slots__ = ("mask",)
+
+    mask: int
+
+    def __new__(cls, stroke: str = ""):
         """
         >>> S("TKPW-PB")
         'TKPW-PB'
@@ -33,23 +61,84 @@ class S:
         'TKPW*PB'
         >>> S("AOE")
         'AOE'
+        >>> S("TKPW-PB") is S("TKPW-PB")
+        True
         """
-        self.keys: Set[str] = set(normalise_stroke(stroke))
+        try:
+            return _PARSED[stroke]
+        except KeyError:
+            pass
+
+        mask = 0
+        for key in normalise_stroke(stroke):
+            mask |= _KEY_BITS[key]
+
+        instance = _PARSED[stroke] = cls.from_mask(mask)
+        return instance
+
+    @classmethod
+    def from_mask(cls, mask: int) -> "S":
+        """
+        >>> S.from_mask(S("SAO*PL").mask)
+        'SAO*PL'
+        >>> S.from_mask(S("SAO*PL").mask) is S("SAO*PL")
+        True
+        """
+        try:
+            return _INTERNED[mask]
+        except KeyError:
+            pass
+
+        stroke = object.__new__(cls)
+        object.__setattr__(stroke, "mask", mask)
+        _INTERNED[mask] = stroke
+        return stroke
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"S is immutable: cannot set {name}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"S is immutable: cannot delete {name}")
+
+    def __reduce__(self):
+        return (S, (str(self),))
+
+    @property
+    def keys(self) -> FrozenSet[str]:
+        """
+        >>> sorted(S("S*").keys)
+        ['*', 'S']
+        """
+        return frozenset(k for k, bit in _KEY_BITS.items() if self.mask & bit)
 
     def __repr__(self):
         return f"'{str(self)}'"
 
     def __str__(self):
-        keys = list(self.keys)
-        if not any(implicit_dash in keys for implicit_dash in "AO*EU"):
-            keys.append("-")
-        text = "".join(sorted(keys, key=lambda k: steno_order.index(k))).upper()
+        try:
+            return _TEXT[self]
+        except KeyError:
+            pass
+
+        mask = self.mask
+        if not mask & _IMPLICIT_DASH:
+            mask |= _DASH
+
+        keys = []
+        while mask:
+            bit = mask & -mask
+            keys.append(_BIT_KEYS[bit])
+            mask ^= bit
+
+        text = "".join(keys).upper()
         if text.endswith("-"):
             text = text[:-1]
+
+        _TEXT[self] = text
         return text
 
     def __len__(self):
-        return len(self.keys)
+        return bin(self.mask).count("1")
 
     def __contains__(self, item):
         """
@@ -60,7 +149,7 @@ class S:
         """
         if isinstance(item, str):
             item = S(item)
-        return self.keys >= item.keys
+        return self.mask & item.mask == item.mask
 
     def __sub__(self, item):
         """
@@ -73,21 +162,24 @@ class S:
         'W'
         """
         assert (
-            self.keys >= item.keys
+            self.mask & item.mask == item.mask
         ), f"S.__sub__: Not all keys in {item} are present in {self}"
-        new_stroke = copy.deepcopy(self)
-        new_stroke.keys -= item.keys
-        return new_stroke
+        return S.from_mask(self.mask & ~item.mask)
 
     def __add__(self, item):
         """
         >>> S("SAOPL") + S("*")
         'SAO*PL'
         """
-        assert not self.keys & item.keys, f"S.__add__: {self} and {item} overlap"
-        new_stroke = copy.deepcopy(self)
-        new_stroke.keys |= item.keys
-        return new_stroke
+        assert not self.mask & item.mask, f"S.__add__: {self} and {item} overlap"
+        return S.from_mask(self.mask | item.mask)
+
+    def __and__(self, item):
+        """
+        >>> S("SAO*PL") & S("AOEU")
+        'AO'
+        """
+        return S.from_mask(self.mask & item.mask)
 
     def __lt__(self, other) -> bool:
         """True if all keys (apart from star) in ``self`` are left of ``other``.
@@ -99,16 +191,29 @@ class S:
         if self.empty():
             return not other.empty()
 
-        rightmost_1 = max(steno_order.index(k) for k in self.keys if k not in "-*")
-        leftmost_2 = min(steno_order.index(k) for k in other.keys if k not in "-*")
-        return not (self.keys & other.keys) and rightmost_1 < leftmost_2
+        if self.mask & other.mask:
+            return False
+
+        left = self.mask & ~_STAR
+        right = other.mask & ~_STAR
+        # the rightmost key of ``left`` must precede the leftmost of ``right``
+        return bool(right) and left.bit_length() < (right & -right).bit_length()
 
     def __eq__(self, other) -> bool:
         """
         >>> S("") == S("")
         True
         """
-        return self.keys == other.keys
+        if not isinstance(other, S):
+            return NotImplemented
+        return self.mask == other.mask
+
+    def __hash__(self) -> int:
+        """
+        >>> len({S("TKPW-PB"), S("TKPWPB"), S("-PB")})
+        2
+        """
+        return hash(self.mask)
 
     def empty(self) -> bool:
         """
@@ -119,7 +224,7 @@ class S:
         >>> S("S-").empty()
         False
         """
-        return self.keys <= {"*"}
+        return not self.mask & ~_STAR
 
     @staticmethod
     def from_brief(brief: str):
@@ -130,6 +235,9 @@ class S:
         return [S(stroke) for stroke in brief.split("/")]
 
 
+_STROKE_PATTERN = re.compile(r"(S?T?K?P?W?H?R?)(-?A?O?\*?E?U?)(F?R?P?B?L?G?T?S?D?Z?)")
+
+
 def normalise_stroke(stroke: str) -> str:
     """Doesn't handle
 
@@ -146,9 +254,7 @@ def normalise_stroke(stroke: str) -> str:
     >>> normalise_stroke("S*")
     'S*'
     """
-    pattern = re.compile(r"(S?T?K?P?W?H?R?)(-?A?O?\*?E?U?)(F?R?P?B?L?G?T?S?D?Z?)")
-
-    match = pattern.fullmatch(stroke)
+    match = _STROKE_PATTERN.fullmatch(stroke)
     assert match is not None, f"S is not in steno order: {stroke}"
 
     return "".join(
@@ -254,6 +360,123 @@ phoneme_to_key_stars = [
     if "*" in key
 ]
 
+
+Theory = Iterable[Tuple[Iterable[str], Iterable[str]]]
+
+
+class PhonemeTable:
+    """A phoneme-to-key table, compiled into a trie over the phonemes so that
+    all phonemes occurring in a sound can be found in one walk over it.
+    """
+
+    def __init__(self, entries: List[Tuple[str, S]]):
+        self.entries = list(entries)
+        # phoneme => the indexes of its entries
+        self._trie: ipa.Trie[int] = ipa.Trie(
+            (phoneme, ix) for ix, (phoneme, _) in enumerate(self.entries)
+        )
+        # stroke mask => the table of the entries whose keys are all in it
+        self._within: Dict[int, "PhonemeTable"] = dict()
+        self._digest: Optional[str] = None
+
+    @classmethod
+    def from_theory(cls, theory: Theory) -> "PhonemeTable":
+        """Compiles a theory given, as ``known_phonemes_plover`` is, as pairs
+        of phonemes and the keys that each of them may be written with.
+
+        >>> PhonemeTable.from_theory([(["b"], ["PW", "-B"])]).entries
+        [('b', 'PW'), ('b', '-B')]
+        """
+        return cls(
+            [
+                (phoneme, S(key))
+                for phonemes, keys in theory
+                for phoneme in phonemes
+                for key in keys
+            ]
+        )
+
+    @classmethod
+    def from_file(cls, path: Path) -> "PhonemeTable":
+        """Loads a theory from a JSON file of ``[[phonemes...], [keys...]]``
+        pairs.
+        """
+        return cls.from_theory(json.loads(path.read_text(encoding="utf-8")))
+
+    def __reduce__(self):
+        return (PhonemeTable, (self.entries,))
+
+    @property
+    def digest(self) -> str:
+        """A digest of the entries, which determine any alignment made with
+        this table.
+        """
+        if self._digest is None:
+            self._digest = hashlib.sha1(repr(self.entries).encode("utf-8")).hexdigest()[:16]
+        return self._digest
+
+    def within(self, stroke: S) -> "PhonemeTable":
+        """The table of the entries whose keys are all in ``stroke``, compiled
+        the first time it is asked for.
+
+        >>> table = PhonemeTable([("b", S("PW")), ("ɑː", S("AR")), ("n", S("-PB"))])
+        >>> table.within(S("PWAR")).entries
+        [('b', 'PW'), ('ɑː', 'AR')]
+        >>> table.within(S("PWAR")) is table.within(S("PWAR"))
+        True
+        """
+        try:
+            return self._within[stroke.mask]
+        except KeyError:
+            pass
+
+        table = self._within[stroke.mask] = PhonemeTable(
+            [(phoneme, keys) for phoneme, keys in self.entries if keys in stroke]
+        )
+        return table
+
+    def matches(self, phonemes: str) -> List[Tuple[str, S, int]]:
+        """All entries whose phoneme occurs in ``phonemes``, as ``(phoneme,
+        stroke, position of its first occurrence)`` in table order.
+
+        >>> PhonemeTable([("b", S("PW")), ("ɑː", S("AR")), ("n", S("-PB"))]).matches("bˈɑːb")
+        [('b', 'PW', 0), ('ɑː', 'AR', 2)]
+        """
+        first: Dict[int, int] = dict()
+
+        for start in range(len(phonemes)):
+            for _, ixs in self._trie.prefixes(phonemes, start):
+                for ix in ixs:
+                    first.setdefault(ix, start)
+
+        return [
+            (self.entries[ix][0], self.entries[ix][1], position)
+            for ix, position in sorted(first.items())
+        ]
+
+
+phoneme_table = PhonemeTable(phoneme_to_key)
+
+THEORIES: Dict[str, PhonemeTable] = {
+    "plover": phoneme_table,
+    "phoenix": PhonemeTable.from_theory(known_phonemes_phoenix),
+}
+
+_THEORY = phoneme_table
+
+
+def set_theory(theory: Union[str, PhonemeTable]) -> None:
+    """Makes ``theory``, a table or the name of one of ``THEORIES``, the one
+    that strokes are aligned to pronunciations with.
+    """
+    global _THEORY
+    _THEORY = THEORIES[theory] if isinstance(theory, str) else theory
+
+
+def current_theory() -> PhonemeTable:
+    return _THEORY
+
+
 class T(NamedTuple):
     keys: S
     phonemes: str
@@ -273,12 +496,46 @@ class T(NamedTuple):
         """
         return self.keys == other.keys and self.phonemes == other.phonemes
 
+    def __hash__(self) -> int:
+        """
+        >>> T(S("PH"), "m") in {T(S("PH"), "m")}
+        True
+        """
+        return hash((self.keys, self.phonemes))
+
+
+
+@functools.lru_cache(maxsize=None)
+def has_consonant(phonemes: str) -> bool:
+    """
+    >>> has_consonant("ˈaɪ"), has_consonant("dʒ")
+    (False, True)
+    """
+    return any(p in phonemes for p in ipa.consonants)
+
+
+State = Tuple[Tuple[S, ...], str, S]
 
 
 class N(NamedTuple):
     tokens: List[T]
-    remaining_strokes: List[S]
+    remaining_strokes: Tuple[S, ...]
     remaining_phonemes: str
+    # ``metric()``, maintained incrementally as tokens are added
+    priority: int = 0
+
+    def state(self) -> State:
+        """Everything that determines how this node can be expanded.
+
+        >>> N([T(S("PW"), "b")], (S("AR"),), "ɑː").state()
+        (('AR',), 'ɑː', 'PW')
+        """
+        try:
+            last_stroke = self.tokens[-1].keys
+        except IndexError:
+            last_stroke = S("")
+
+        return (tuple(self.remaining_strokes), self.remaining_phonemes, last_stroke)
 
     def metric(self) -> int:
         """Counts the number of unmatched keys (keys without a sound).
@@ -292,22 +549,22 @@ class N(NamedTuple):
         8
         """
         # treat each token as matching only one consonant (the others are trailing)
-        consonant_tokens = [
-            tok for tok in self.tokens if any(p in tok.phonemes for p in ipa.consonants)
-        ]
+        consonant_tokens = [tok for tok in self.tokens if has_consonant(tok.phonemes)]
         full_sound = (
             "".join(tok.phonemes for tok in self.tokens) + self.remaining_phonemes
         )
-        all_consonants = [x for x in ipa.tokenize(full_sound) if x in ipa.consonants]
-        return len(all_consonants) - len(consonant_tokens)
+        return ipa.analyse(full_sound).consonants - len(consonant_tokens)
 
     def __lt__(self, other) -> bool:
         """Compare by unmatched consonant metric.
+
+        >>> N([], [], "", priority=1) < N([], [], "", priority=2)
+        True
         """
-        return self.metric() < other.metric()
+        return self.priority < other.priority
 
 
-def parse_phoneme_tokens(tokens: List[T]) -> List[str]:
+def parse_phoneme_tokens(tokens: Iterable[T]) -> List[str]:
     """
     >>> parse_phoneme_tokens(
     ...     [
@@ -336,11 +593,15 @@ def parse_phoneme_tokens(tokens: List[T]) -> List[str]:
     return sounds
 
 
-def compact_tokens(tokens: List[T]) -> List[T]:
+def compact_tokens(tokens: Iterable[T]) -> Generator[T, None, None]:
     """Propagate sounds to the earliest stroke (fixing up stroke boundary
     issues).
 
-    >>> compact_tokens([
+    A token with keys but no phonemes takes the phonemes of the first
+    phonemes-only token after it, unless another stroke's keys come first.
+    ``tokens`` is consumed in a single pass, and not modified.
+
+    >>> tokens = [
     ...     T(S('PH'), 'm'),
     ...     T(S('AOEU'), ''),
     ...     T(S(''), ''),
@@ -349,57 +610,51 @@ def compact_tokens(tokens: List[T]) -> List[T]:
     ...     T(S('U'), 'ə'),
     ...     T(S('-S'), 's'),
     ...     T(S(''), '')
-    ... ])
+    ... ]
+    >>> list(compact_tokens(tokens))
     [('PH'=>'m'), ('AOEU'=>'ˈaɪ'), (/), ('TPH'=>'n'), ('U'=>'ə'), ('-S'=>'s'), (/)]
+    >>> len(tokens)
+    8
     """
-    _LOG.debug("compact_tokens: %s", tokens)
-
-    new_tokens = list()
-
-    acc_keys = S("")
-    acc_phonemes = ""
-    acc_blank = None
-
-    phonemes_only = lambda t: t.phonemes and not t.keys
-    keys_only = lambda t: t.keys and not t.phonemes
-    empty_token = lambda t: not t.keys and not t.phonemes
-    full_token = lambda t: t.keys and t.phonemes
-
-    while tokens:
-        current = tokens.pop(0)
-
-        if not tokens:
-            # current is last token
-            new_tokens.append(current)
-
-        elif full_token(current) or empty_token(current):
-            new_tokens.append(current)
-
-        elif keys_only(current):
-            new_phonemes = ""
-
-            # search ahead for a stroke with phonemes only
-            for i in range(len(tokens)):
-                if tokens[i].keys:
-                    # reached another stroke
-                    break
-                if phonemes_only(tokens[i]):
-                    new_phonemes = tokens[i].phonemes
-                    del tokens[i]
-                    break
-
-            new_tokens.append(T(current.keys, new_phonemes))
-
+    # a keys-only token waiting for its phonemes, and the empty tokens seen
+    # since then (which must come after it)
+    pending: Optional[T] = None
+    skipped: List[T] = list()
+
+    for token in tokens:
+        if pending is not None:
+            if token.keys:
+                # reached another stroke
+                yield T(pending.keys, "")
+            elif token.phonemes:
+                yield T(pending.keys, token.phonemes)
+            else:
+                skipped.append(token)
+                continue
+
+            yield from skipped
+            pending, skipped = None, list()
+
+            if not token.keys:
+                # the phonemes were moved to the pending token
+                continue
+
+        if token.keys and not token.phonemes:
+            pending = token
         else:
-            new_tokens.append(current)
+            yield token
 
-    _LOG.debug("compact_tokens done: %s", new_tokens)
+    if pending is not None:
+        yield pending
+        yield from skipped
 
-    return new_tokens
 
+def tokenize_phonemes(
+    pronunciation: str, strokes: str, table: Optional[PhonemeTable] = None
+) -> List[T]:
+    """Aligns ``strokes`` to ``pronunciation`` using ``table``, by default the
+    current theory.
 
-def tokenize_phonemes(pronunciation: str, strokes: str) -> List[T]:
-    """
     >>> tokenize_phonemes("b", "PW-")
     [('PW'=>'b'), (/)]
 
@@ -421,16 +676,123 @@ def tokenize_phonemes(pronunciation: str, strokes: str) -> List[T]:
     >>> tokenize_phonemes("ɐksˈɛləɹənt", "ABG/SEL/RAPBT")
     [('A'=>'ɐ'), ('-BG'=>'k'), (/), ('S'=>'s'), ('E'=>'ˈɛ'), ('-L'=>'l'), (/), (''=>'ə'), ('R'=>'ɹ'), ('A'=>'ə'), ('-PB'=>'n'), ('-T'=>'t'), (/)]
     """
+    start = time.perf_counter()
+    try:
+        return list(compact_tokens(_align(pronunciation, strokes, table)))
+    finally:
+        report.record_call("tokenize_phonemes", time.perf_counter() - start)
+
+
+# what expanding a state adds: the tokens appended, the remaining strokes and
+# phonemes after them, and the change in priority
+Expansion = Tuple[Tuple[T, ...], Tuple[S, ...], str, int]
+
+# sub-alignments shared by the briefs of a batch
+ALIGN_MEMO_SIZE = 1 << 16
+
+
+def _expand(table: PhonemeTable, state: State) -> List[Expansion]:
+    """The children of a node in ``state``, which only depend on the state.
+    """
+    remaining_strokes, remaining_phonemes, last_stroke = state
+    current_stroke = remaining_strokes[0]
+
+    children: List[Expansion] = list()
+
+    if not current_stroke:
+        children.append(((T(S(""), ""),), remaining_strokes[1:], remaining_phonemes, 0))
+
+    if current_stroke in S("AO*EU"):
+        # just vowels: move to next stroke
+        children.append(
+            (
+                (T(current_stroke, ""), T(S(""), "")),
+                remaining_strokes[1:],
+                remaining_phonemes,
+                0,
+            )
+        )
+
+    # only the entries that fit in what is left of the stroke
+    for phoneme, stroke, position in table.within(current_stroke).matches(
+        remaining_phonemes
+    ):
+        if last_stroke < stroke:
+            pre = remaining_phonemes[:position]
+            post = remaining_phonemes[position + len(phoneme) :]
+
+            updated_stroke = current_stroke
+            new_tokens = list()
+
+            # add a missing token entry for the vowels if this stroke has
+            # 'switched' sides
+            vowel_stroke = S("AOEU")
+            if vowel_stroke < stroke:
+                vowel_stroke &= updated_stroke
+            else:
+                vowel_stroke = S("")
+
+            # the full sound doesn't change, so the metric only drops by
+            # the new tokens that match a consonant
+            delta = -has_consonant(phoneme)
+
+            if pre:
+                new_tokens.append(T(vowel_stroke, pre))
+                updated_stroke -= vowel_stroke
+                delta -= has_consonant(pre)
+            new_tokens.append(T(stroke, phoneme))
+            updated_stroke -= stroke
+
+            children.append(
+                (
+                    tuple(new_tokens),
+                    (updated_stroke,) + remaining_strokes[1:],
+                    post,
+                    delta,
+                )
+            )
+
+    return children
+
+
+def _align(
+    pronunciation: str,
+    strokes: str,
+    table: Optional[PhonemeTable] = None,
+    expand: Optional[Callable[[State], List[Expansion]]] = None,
+) -> List[T]:
+    """Best-first search for the tokens matching ``strokes`` to
+    ``pronunciation``, before they are compacted.
+
+    The children of each state come from ``expand``, which may be shared
+    between searches with the same ``table``.
+    """
+    if table is None:
+        table = _THEORY
+    if expand is None:
+        expand = functools.partial(_expand, table)
+
     q: List[N] = list()
 
-    heapq.heappush(
-        q,
-        N(
-            tokens=[],
-            remaining_strokes=[S(s) for s in strokes.split("/")],
-            remaining_phonemes=pronunciation,
-        ),
+    # Many paths reach the same state, and everything after that point is the
+    # same for all of them: only the best one is pushed, and each state is
+    # expanded once.
+    best: Dict[State, int] = dict()
+    expanded: Set[State] = set()
+
+    def push(node: N) -> None:
+        state = node.state()
+        if state in expanded or best.get(state, node.priority + 1) <= node.priority:
+            return
+        best[state] = node.priority
+        heapq.heappush(q, node)
+
+    root = N(
+        tokens=[],
+        remaining_strokes=tuple(S(s) for s in strokes.split("/")),
+        remaining_phonemes=pronunciation,
     )
+    push(root._replace(priority=root.metric()))
 
     while q:
         # (PW-, b)     (AR, a:) (/, ) (TKPW-, g) (-PB, in) (/, )
@@ -441,76 +803,72 @@ def tokenize_phonemes(pronunciation: str, strokes: str) -> List[T]:
             # reached the goal
             break
 
+        state = n.state()
+        if state in expanded or n.priority > best[state]:
+            # a better path to this state was found after this one was pushed
+            continue
+        expanded.add(state)
+
         if not n.remaining_strokes:
             # reached the end but still have phonemes: give up
             continue
 
-        current_stroke = n.remaining_strokes[0]
-
-        if not current_stroke:
-            heapq.heappush(
-                q,
-                n._replace(
-                    tokens=n.tokens + [T(S(""), "")],
-                    remaining_strokes=n.remaining_strokes[1:],
+        for tokens, remaining_strokes, remaining_phonemes, delta in expand(state):
+            push(
+                N(
+                    tokens=n.tokens + list(tokens),
+                    remaining_strokes=remaining_strokes,
+                    remaining_phonemes=remaining_phonemes,
+                    priority=n.priority + delta,
                 ),
             )
+    else:
+        return []
 
-        if current_stroke.keys <= set("AO*EU"):
-            # just vowels: move to next stroke
-            heapq.heappush(
-                q,
-                n._replace(
-                    tokens=n.tokens + [T(current_stroke, ""), T(S(""), "")],
-                    remaining_strokes=n.remaining_strokes[1:],
-                ),
-            )
+    return n.tokens
 
-        try:
-            last_stroke = n.tokens[-1].keys
-        except IndexError:
-            last_stroke = S("")
 
-        for phoneme, stroke in phoneme_to_key:
-            if (
-                stroke in n.remaining_strokes[0]
-                and phoneme in n.remaining_phonemes
-                and last_stroke < stroke
-            ):
-                pre, post = n.remaining_phonemes.split(phoneme, maxsplit=1)
-
-                updated_stroke = copy.deepcopy(current_stroke)
-                new_tokens = list(n.tokens)
-
-                # add a missing token entry for the vowels if this stroke has
-                # 'switched' sides
-                vowel_stroke = S("AOEU")
-                if vowel_stroke < stroke:
-                    vowel_stroke.keys &= updated_stroke.keys
-                else:
-                    vowel_stroke = S("")
-
-                if pre:
-                    new_tokens.append(T(vowel_stroke, pre))
-                    updated_stroke -= vowel_stroke
-                new_tokens.append(T(stroke, phoneme))
-                updated_stroke -= stroke
-
-                heapq.heappush(
-                    q,
-                    N(
-                        tokens=new_tokens,
-                        remaining_strokes=([updated_stroke] + n.remaining_strokes[1:]),
-                        remaining_phonemes=post,
-                    ),
-                )
-    else:
-        return []
+def _batch_expand(table: Optional[PhonemeTable]) -> Callable[[State], List[Expansion]]:
+    if table is None:
+        table = _THEORY
+    return functools.lru_cache(maxsize=ALIGN_MEMO_SIZE)(functools.partial(_expand, table))
+
 
-    # clean up tokens
+def tokenize_phonemes_many(
+    pairs: Iterable[Tuple[str, str]], table: Optional[PhonemeTable] = None
+) -> Generator[List[T], None, None]:
+    """:func:`tokenize_phonemes` for each ``(pronunciation, strokes)`` of
+    ``pairs``, sharing the expansion of the states that their searches have
+    in common (such as a final ``/-BG`` against ``k``).
 
-    return compact_tokens(n.tokens)
+    >>> list(tokenize_phonemes_many([("mˈadʒɪk", "PHAPBLG/EUBG"), ("lˈɒdʒɪk", "HROPBLG/EUBG")]))
+    [[('PH'=>'m'), ('A'=>'ˈa'), ('-PBLG'=>'dʒ'), (/), ('EU'=>'ɪ'), ('-BG'=>'k'), (/)], [('HR'=>'l'), ('O'=>'ˈɒ'), ('-PBLG'=>'dʒ'), (/), ('EU'=>'ɪ'), ('-BG'=>'k'), (/)]]
+    """
+    expand = _batch_expand(table)
+    for pronunciation, strokes in pairs:
+        start = time.perf_counter()
+        try:
+            tokens = list(compact_tokens(_align(pronunciation, strokes, table, expand)))
+        finally:
+            # before yielding, so that the caller's time is not counted
+            report.record_call("tokenize_phonemes", time.perf_counter() - start)
+        yield tokens
 
 
-def split_strokes(pronunciation: str, strokes: str) -> List[str]:
-    return parse_phoneme_tokens(tokenize_phonemes(pronunciation, strokes))
+def split_strokes(
+    pronunciation: str, strokes: str, table: Optional[PhonemeTable] = None
+) -> List[str]:
+    return parse_phoneme_tokens(compact_tokens(_align(pronunciation, strokes, table)))
+
+
+def split_strokes_many(
+    pairs: Iterable[Tuple[str, str]], table: Optional[PhonemeTable] = None
+) -> Generator[List[str], None, None]:
+    """:func:`split_strokes` for each ``(pronunciation, strokes)`` of
+    ``pairs``, sharing sub-alignments as :func:`tokenize_phonemes_many` does.
+    """
+    expand = _batch_expand(table)
+    for pronunciation, strokes in pairs:
+        yield parse_phoneme_tokens(
+            compact_tokens(_align(pronunciation, strokes, table, expand))
+        )
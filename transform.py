@@ -5,14 +5,25 @@
 """
 
 from pathlib import Path
-from typing import Dict, Generator
-import dbm
-import json
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Generator, Iterable, Iterator, List, Mapping, MutableMapping, NamedTuple, Optional, Set, Tuple, Union
+import contextlib
+import functools
+import hashlib
+import os
 import re
 import string
 
-from stroke import S, T, tokenize_phonemes, parse_phoneme_tokens
+from cache import TieredCache
+from jsonstream import JSONDictionary, read_entries, write_sorted
+from manifest import EntryOutputs, Manifest, digest_entries, source_digest
+from report import RunReport
+from stenodict import StenoDictionary, indexed
+from stroke import S, T, tokenize_phonemes, tokenize_phonemes_many, parse_phoneme_tokens
+from stroke import THEORIES, PhonemeTable, current_theory
+import checkpoint
 import ipa
+import report
 
 # DICTIONARY = Path(__file__).parent / "dict.json"
 DICTIONARY = Path(__file__).parent / "phoenix_base.json"
@@ -20,6 +31,219 @@ DICTIONARY = Path(__file__).parent / "phoenix_base.json"
 START_OF_STROKE = r"(?P<startofstroke>^|/)"
 END_OF_STROKE = r"(?P<endofstroke>/|$)"
 
+# the rules are made of these; a change to any of them invalidates a manifest
+RULE_SOURCES = [
+    Path(__file__).parent / f"{name}.py" for name in ("transform", "stroke", "ipa")
+]
+
+Entries = Iterable[Tuple[str, str]]
+
+# rule => function listing the translations that the rule will look up
+# pronunciations for, given the entries of its input dictionary
+PRONUNCIATIONS: Dict[Callable, Callable[[Entries], Iterable[str]]] = dict()
+
+
+def needs_pronunciations(planner: Callable[[Entries], Iterable[str]]):
+    """Registers ``planner`` as the pronunciation planner of the decorated
+    rule, so that :func:`prefetch_pronunciations` can look them up ahead of
+    time.
+    """
+
+    def register(rule):
+        PRONUNCIATIONS[rule] = planner
+        return rule
+
+    return register
+
+
+# rules that can spread their work over several processes
+PARALLEL: Set[Callable] = set()
+
+
+def parallel(rule):
+    """Marks the decorated rule as taking a ``jobs`` argument."""
+    PARALLEL.add(rule)
+    return rule
+
+
+# rules that can reuse what they made of each unchanged entry
+ENTRYWISE: Set[Callable] = set()
+
+
+def entrywise(rule):
+    """Marks the decorated rule as taking an ``outputs`` argument, a
+    :class:`manifest.EntryOutputs` of what it made of each entry last time.
+    """
+    ENTRYWISE.add(rule)
+    return rule
+
+
+# rules that align strokes to pronunciations
+ALIGNS: Set[Callable] = set()
+
+
+def aligns(rule):
+    """Marks the decorated rule as taking a ``table``, the
+    :class:`stroke.PhonemeTable` of the theory to align strokes with.
+    """
+    ALIGNS.add(rule)
+    return rule
+
+
+def run_rule(
+    rule,
+    dictionary: MutableMapping[str, str],
+    cache: Optional[TieredCache] = None,
+    jobs: int = 1,
+    run_report: Optional[RunReport] = None,
+    outputs: Optional[EntryOutputs] = None,
+    scanned: Optional[int] = None,
+    table: Optional[PhonemeTable] = None,
+) -> MutableMapping[str, str]:
+    """Applies ``rule`` to ``dictionary``, passing ``cache``, ``jobs``,
+    ``outputs`` and ``table`` to the rules that take them, and recording the
+    step in ``run_report``, along with the number of entries ``scanned`` for
+    it.
+    """
+    kwargs: Dict[str, Any] = dict()
+    if rule in PRONUNCIATIONS:
+        kwargs["cache"] = cache
+    if rule in PARALLEL:
+        kwargs["jobs"] = jobs
+    if rule in ENTRYWISE and outputs is not None:
+        kwargs["outputs"] = outputs
+    if rule in ALIGNS and table is not None:
+        kwargs["table"] = table
+
+    if run_report is None:
+        return rule(dictionary, **kwargs)
+    return run_report.step(
+        rule.__name__, lambda d: rule(d, **kwargs), dictionary, scanned
+    )
+
+
+def prefetch_pronunciations(
+    steps,
+    dictionary: Union[Mapping[str, str], JSONDictionary],
+    cache: TieredCache,
+    jobs: int = 1,
+):
+    """Looks up, in one parallel batch, every pronunciation that ``steps`` will
+    need, so that the rules themselves only hit ``cache``.
+    """
+    words = dict.fromkeys(
+        word
+        for step in steps
+        if step in PRONUNCIATIONS
+        for word in PRONUNCIATIONS[step](dictionary.items())
+    )
+    ipa.word_to_ipa_many(words, cache=cache.pronunciations, jobs=jobs)
+
+
+@contextlib.contextmanager
+def open_cache(cache: Optional[TieredCache] = None) -> Iterator[TieredCache]:
+    """Yields ``cache``, or if there is none, the on-disk cache for as long as
+    it is needed.
+    """
+    if cache is not None:
+        yield cache
+    else:
+        with TieredCache.open("ipa_cache") as cache:
+            yield cache
+
+
+class Surface(NamedTuple):
+    """The entries that a rule reads or writes.
+
+    ``contains(stroke, tran)`` is true for every entry that the rule may
+    change, delete, add, or look up to check for a conflict.  The rule never
+    touches the other entries, which are passed through unchanged, or dropped
+    if the rule does not keep them.
+    """
+
+    contains: Callable[[str, str], bool]
+    keep_others: bool = True
+
+
+# rule => the entries it needs to see together when streaming
+SURFACES: Dict[Callable, Surface] = dict()
+
+
+def streams(contains: Callable[[str, str], bool], keep_others: bool = True):
+    """Registers the lookup surface of the decorated rule, so that it can be
+    run as a :func:`stream_rule` stage.
+    """
+
+    def register(rule):
+        SURFACES[rule] = Surface(contains, keep_others)
+        return rule
+
+    return register
+
+
+def stream_rule(
+    rule,
+    entries: Entries,
+    cache: Optional[TieredCache] = None,
+    jobs: int = 1,
+    manifest: Optional[Manifest] = None,
+    stage: str = "",
+    run_report: Optional[RunReport] = None,
+    table: Optional[PhonemeTable] = None,
+) -> Generator[Tuple[str, str], None, None]:
+    """Runs ``rule`` as a generator stage over ``entries``.
+
+    Entries outside the rule's surface are yielded as they arrive; only the
+    ones inside it are held, and the rule is applied to them once ``entries``
+    is exhausted.  With a ``manifest``, the rule is skipped if it was already
+    applied to the same held entries, and the same pronunciations of them, as
+    part of ``stage``.  Otherwise an
+    :func:`entrywise` rule only works on the held entries that changed, and
+    merges what it made of them with what it made of the others last time.
+
+    >>> list(stream_rule(rule_PLT_consistency, [("*PLT", "{^ment}"), ("TEFT", "test")]))
+    [('TEFT', 'test'), ('-PLT', '{^ment}')]
+    """
+    surface = SURFACES[rule]
+
+    held = StenoDictionary()
+    scanned = 0
+    for stroke, tran in entries:
+        scanned += 1
+        if surface.contains(stroke, tran):
+            held[stroke] = tran
+        elif surface.keep_others:
+            yield stroke, tran
+
+    if manifest is None:
+        yield from run_rule(
+            rule, held, cache, jobs, run_report, scanned=scanned, table=table
+        ).items()
+        return
+
+    digest = digest_entries(held.items())
+    if rule in PRONUNCIATIONS:
+        # the output depends on the pronunciations the rule looks up too
+        with open_cache(cache) as pronouncing:
+            heard = [
+                (word, ipa.word_to_ipa(word, cache=pronouncing.pronunciations))
+                for word in PRONUNCIATIONS[rule](held.items())
+            ]
+        digest = digest_entries([(digest, "")] + heard)
+    outputs = manifest.entry_outputs(stage) if rule in ENTRYWISE else None
+    output = manifest.lookup(stage, digest)
+    if output is None:
+        output = list(
+            run_rule(rule, held, cache, jobs, run_report, outputs, scanned, table).items()
+        )
+    else:
+        if outputs is not None:
+            outputs.keep_all()
+        if run_report is not None:
+            run_report.reused(rule.__name__)
+    manifest.record(stage, digest, output, outputs)
+    yield from output
+
 
 def add_to_dict(d, k, v):
     """Adds the key-value pair to the dictionary ``d`` unless it already exists.
@@ -29,9 +253,38 @@ def add_to_dict(d, k, v):
             # print("Exists", k, v)
             pass
         else:
+            report.count("conflicts")
             raise ValueError(f"Existing '{k}': '{d[k]}' when trying '{v}'")
     else:
         d[k] = v
+        report.count("entries_added")
+
+
+def rename_in_dict(d, stroke, new_stroke, tran):
+    """Moves ``tran`` in the :class:`stenodict.StenoDictionary` ``d`` from
+    ``stroke`` to ``new_stroke``, in its place, unless another translation
+    already exists there.
+    """
+    if new_stroke == stroke:
+        return
+    if new_stroke in d:
+        add_to_dict(d, new_stroke, tran)
+        # merged into the existing entry
+        report.count("entries_removed")
+    else:
+        report.count("entries_added")
+        report.count("entries_removed")
+    d.rename(stroke, new_stroke)
+
+
+def set_in_dict(d, k, v):
+    """Sets ``k`` to ``v`` in the dictionary ``d``, whether or not it exists.
+    """
+    if k not in d:
+        report.count("entries_added")
+    elif d[k] != v:
+        report.count("entries_modified")
+    d[k] = v
 
 
 def remove_from_dict(d, k, v):
@@ -39,8 +292,10 @@ def remove_from_dict(d, k, v):
     exists.
     """
     if not d[k] == v:
+        report.count("conflicts")
         raise ValueError(f"Tried to delete '{k}': '{v}' (is '{d[k]}')")
     del d[k]
+    report.count("entries_removed")
 
 
 def split_list(xs, needle):
@@ -57,8 +312,55 @@ def split_list(xs, needle):
             res.append(x)
 
 
-def apply_vop(brief: str, tran: str, cache=None) -> str:
-    """Remove any short unstressed vowels from multi-stroke words.
+# bump whenever apply_vop (or the alignment it relies on) changes its output
+VOP_VERSION = 1
+
+# cached apply_vop results are only valid for the tables they were computed
+# with, so they are keyed on a digest of those tables
+@functools.lru_cache(maxsize=None)
+def _vop_tables_digest(theory_digest: str) -> str:
+    return hashlib.sha1(
+        repr(
+            (
+                VOP_VERSION,
+                theory_digest,
+                ipa.vowels,
+                ipa.consonants,
+                ipa.schwa_like,
+            )
+        ).encode("utf-8")
+    ).hexdigest()[:16]
+
+
+def vop_cache_key(
+    brief: str, tran: str, pronunciation: str, table: Optional[PhonemeTable] = None
+) -> str:
+    """Keyed on ``table``, by default the current theory, which the alignment
+    is made with, and on the pronunciation it was made from, whichever
+    backend that came from.
+
+    >>> key = vop_cache_key("PHAPBLG/EUBG", "magic", "mˈadʒɪk")
+    >>> key.startswith(_vop_tables_digest(current_theory().digest) + ":PHAPBLG/EUBG:magic:")
+    True
+    >>> vop_cache_key("PHAPBLG/EUBG", "magic", "") == key
+    False
+    >>> vop_cache_key("PHAPBLG/EUBG", "magic", "mˈadʒɪk", THEORIES["phoenix"]) == key
+    False
+    """
+    if table is None:
+        table = current_theory()
+    heard = hashlib.sha1(pronunciation.encode("utf-8")).hexdigest()[:16]
+    return f"{_vop_tables_digest(table.digest)}:{brief}:{tran}:{heard}"
+
+
+def apply_vop(
+    brief: str,
+    tran: str,
+    cache: Optional[TieredCache] = None,
+    table: Optional[PhonemeTable] = None,
+) -> str:
+    """Remove any short unstressed vowels from multi-stroke words, aligned
+    with ``table``, by default the current theory.
 
     >>> apply_vop("A/TKREPB/A*L", "adrenal")
     'A/TKREPB/-L'
@@ -73,14 +375,54 @@ def apply_vop(brief: str, tran: str, cache=None) -> str:
     >>> apply_vop("AB/S*EUPBT", "absinthe")
     'AB/S*PBT'
     """
-    # try:
-    #     return cache[str((brief, tran))].decode("utf-8")
-    # except:
-    #     pass
+    ipa_str = ipa.word_to_ipa(
+        tran, cache=cache.pronunciations if cache is not None else None
+    )
+
+    if cache is not None:
+        cached = cache.results.get(vop_cache_key(brief, tran, ipa_str, table))
+        if cached is not None:
+            return cached
 
+    result = reduce_vowels(brief, ipa_str, table)
+
+    if cache is not None:
+        cache.results[vop_cache_key(brief, tran, ipa_str, table)] = result
+
+    return result
+
+
+def reduce_vowels(
+    brief: str, pronunciation: str, table: Optional[PhonemeTable] = None
+) -> str:
+    """Does the work of :func:`apply_vop` given the pronunciation, without
+    touching any cache.
+
+    >>> reduce_vowels("PHAPBLG/EUBG", "mˈadʒɪk")
+    'PHAPBLG/-BG'
+    """
+    return _shorten(
+        brief, tokenize_phonemes(pronunciation=pronunciation, strokes=brief, table=table)
+    )
+
+
+def reduce_vowels_many(
+    pairs: List[Tuple[str, str]], table: Optional[PhonemeTable] = None
+) -> List[str]:
+    """:func:`reduce_vowels` for each ``(brief, pronunciation)`` of ``pairs``,
+    aligned as one batch.
+
+    >>> reduce_vowels_many([("PHAPBLG/EUBG", "mˈadʒɪk"), ("HROPBLG/EUBG", "lˈɒdʒɪk")])
+    ['PHAPBLG/-BG', 'HROPBLG/-BG']
+    """
+    aligned = tokenize_phonemes_many(
+        ((pronunciation, brief) for brief, pronunciation in pairs), table
+    )
+    return [_shorten(brief, phonemes) for (brief, _), phonemes in zip(pairs, aligned)]
+
+
+def _shorten(brief: str, phonemes: List[T]) -> str:
     strokes = S.from_brief(brief)
-    ipa_str = ipa.word_to_ipa(tran, cache=cache)
-    phonemes = tokenize_phonemes(pronunciation=ipa_str, strokes=brief)
     syllables = parse_phoneme_tokens(phonemes)
     phonemes_by_syllable = split_list(phonemes, T(S(""), ""))
 
@@ -90,23 +432,89 @@ def apply_vop(brief: str, tran: str, cache=None) -> str:
 
     for stroke, syllable, tokens in zip(strokes, syllables, phonemes_by_syllable):
         if ipa.is_short_unstressed_syllable(syllable) and not is_first_stroke:
-            stroke.keys -= set("AOEU")
+            stroke -= stroke & S("AOEU")
 
-            if "*" in stroke.keys:
+            if "*" in stroke:
                 # check that the star doesn't correspond to any phonemes
-                if not any(("*" in t.keys.keys and t.phonemes) for t in tokens):
-                    stroke.keys.remove("*")
+                if not any(("*" in t.keys and t.phonemes) for t in tokens):
+                    stroke -= S("*")
 
         shortened_strokes.append(str(stroke))
 
         is_first_stroke = False
 
-    result = "/".join(s for s in shortened_strokes if s)
+    return "/".join(s for s in shortened_strokes if s)
 
-    if cache is not None:
-        cache[str((brief, tran))] = result
 
-    return result
+def _reduce_vowels_reported(
+    pairs: List[Tuple[str, str]], table: Optional[PhonemeTable]
+) -> Tuple[List[str], report.Snapshot]:
+    """:func:`reduce_vowels_many` in a worker process, along with what it
+    counted.
+    """
+    before = report.snapshot()
+    results = reduce_vowels_many(pairs, table)
+    return results, report.since(before)
+
+
+def apply_vop_many(
+    entries: List[Tuple[str, str]],
+    cache: TieredCache,
+    jobs: int = 1,
+    table: Optional[PhonemeTable] = None,
+    pronunciations: Optional[List[str]] = None,
+) -> List[str]:
+    """:func:`apply_vop` over each ``(brief, tran)`` of ``entries``, in order,
+    aligned with ``table``, given the ``pronunciations`` of the entries if
+    they were already looked up.
+
+    The uncached entries are aligned in batches that share their
+    sub-alignments (see :func:`stroke.tokenize_phonemes_many`).  With more
+    than one job, the batches are shared out over a pool of ``jobs``
+    processes.  Cached results and pronunciations are still looked up, and
+    new results written back, in this process.
+    """
+    if pronunciations is None:
+        pronunciations = [
+            ipa.word_to_ipa(tran, cache=cache.pronunciations) for _, tran in entries
+        ]
+    keys = [
+        vop_cache_key(brief, tran, pronunciation, table)
+        for (brief, tran), pronunciation in zip(entries, pronunciations)
+    ]
+    # index of each entry => its result
+    results: Dict[int, str] = dict()
+    for ix, key in enumerate(keys):
+        cached = cache.results.get(key)
+        if cached is not None:
+            results[ix] = cached
+    todo = [ix for ix in range(len(entries)) if ix not in results]
+    if not todo:
+        return [results[ix] for ix in range(len(entries))]
+
+    pairs = [(entries[ix][0], pronunciations[ix]) for ix in todo]
+
+    if jobs <= 1:
+        reduced = reduce_vowels_many(pairs, table)
+    else:
+        if table is None:
+            # the workers' own current theory may not be this one
+            table = current_theory()
+        size = max(1, len(todo) // (jobs * 4))
+        with ProcessPoolExecutor(jobs) as pool:
+            reduced = list()
+            batches = [pairs[i : i + size] for i in range(0, len(pairs), size)]
+            for batch, counted in pool.map(
+                _reduce_vowels_reported, batches, [table] * len(batches)
+            ):
+                report.merge(counted)
+                reduced.extend(batch)
+
+    for ix, result in zip(todo, reduced):
+        results[ix] = result
+        cache.results[keys[ix]] = result
+
+    return [results[ix] for ix in range(len(entries))]
 
 
 def strip_suffix_or_prefix(tran: str) -> str:
@@ -127,21 +535,60 @@ def strip_suffix_or_prefix(tran: str) -> str:
     return tran
 
 
-def rule_AULT_ALT(dictionary: Dict[str, str]) -> Dict[str, str]:
+@streams(lambda stroke, tran: "AULT" in stroke or "ALT" in stroke)
+def rule_AULT_ALT(dictionary: MutableMapping[str, str]) -> MutableMapping[str, str]:
     """Replace all /AULT/ for "{alt^}" with /ALT/
     """
-    new_dict: Dict[str, str] = dict()
+    dictionary = indexed(dictionary)
+    candidates = [(stroke, dictionary[stroke]) for stroke in dictionary.candidates(S("AULT"))]
 
-    for stroke, tran in dictionary.items():
+    for stroke, tran in candidates:
+        new_stroke = stroke
         if "AULT" in stroke and "alt" in tran:
-            stroke = stroke.replace("AULT", "ALT")
+            new_stroke = stroke.replace("AULT", "ALT")
         elif "KWAULT" in stroke and "qualit" in tran:
-            stroke = stroke.replace("AULT", "ALT")
-        new_dict[stroke] = tran
+            new_stroke = stroke.replace("AULT", "ALT")
+        if new_stroke == stroke:
+            continue
+        if new_stroke in dictionary:
+            # replaces the entry there
+            report.count("entries_removed")
+        dictionary.rename(stroke, new_stroke)
+        report.count("entries_added")
+        report.count("entries_removed")
 
-    return new_dict
+    return dictionary
+
+def is_AU_candidate(stroke: str, tran: str) -> bool:
+    """
+    >>> is_AU_candidate("PAUR", "{para^}")
+    False
+    >>> is_AU_candidate("KAUPL", "{com^}")
+    True
+    """
+    # "AU" in first stroke indicates prefix-ness
+    # e.g. /MAUN => mon^, /MON => mon
+    # e.g. /AUR => aero^
+    # e.g. /PAUR => para^
+    # "O" in first stroke indicates "full word"
+    # time to swap that around
+    return (
+        ("AU" in stroke or "A*U" in stroke)
+        and (not stroke.endswith("AU"))  # "-ah" ending
+        and ("AU/R-R" not in stroke)
+        and "o" in tran
+    )
 
-def rule_AU_O(dictionary: Dict[str, str]) -> Dict[str, str]:
+
+def plan_AU_O(entries: Entries) -> Iterable[str]:
+    return (tran for stroke, tran in entries if is_AU_candidate(stroke, tran))
+
+
+@needs_pronunciations(plan_AU_O)
+@streams(lambda stroke, tran: "AU" in stroke or "A*U" in stroke or "O" in stroke)
+def rule_AU_O(
+    dictionary: MutableMapping[str, str], cache: Optional[TieredCache] = None
+) -> MutableMapping[str, str]:
     """Replace all /..AU.. for "o" sounds with /O
     """
     # delete_entries = {"A*UBG": "October"}
@@ -149,9 +596,11 @@ def rule_AU_O(dictionary: Dict[str, str]) -> Dict[str, str]:
     # for stroke, tran in delete_entries.items():
     #     remove_from_dict(dictionary, stroke, tran)
 
-    new_dict: Dict[str, str] = dict(dictionary)
+    dictionary = indexed(dictionary)
+    # the entries as they were, since the rule changes the dictionary in place
+    candidates = [(stroke, dictionary[stroke]) for stroke in dictionary.candidates(S("AU"))]
 
-    remove_from_dict(new_dict, "PWAR/OE", "borrow")
+    remove_from_dict(dictionary, "PWAR/OE", "borrow")
 
     o_sounds = ("əʊ", # volt
                 "ɒ", # office
@@ -172,75 +621,94 @@ def rule_AU_O(dictionary: Dict[str, str]) -> Dict[str, str]:
         "exon"
     ]
 
-    with dbm.open("ipa_cache", "c") as cache:
-        for stroke, tran in dictionary.items():
-            # "AU" in first stroke indicates prefix-ness
-            # e.g. /MAUN => mon^, /MON => mon
-            # e.g. /AUR => aero^
-            # e.g. /PAUR => para^
-            # "O" in first stroke indicates "full word"
-            # time to swap that around
-            if (
-                ("AU" in stroke or "A*U" in stroke)
-                and (not stroke.endswith("AU"))  # "-ah" ending
-                and ("AU/R-R" not in stroke)
-                and "o" in tran
-            ):
-                ipa_str = ipa.word_to_ipa(tran, cache=cache)
+    with open_cache(cache) as cache:
+        for stroke, tran in candidates:
+            if is_AU_candidate(stroke, tran):
+                ipa_str = ipa.word_to_ipa(tran, cache=cache.pronunciations)
                 if any(x in ipa_str for x in o_sounds):
                     o_stroke = stroke.replace("A*U", "O*")
                     o_stroke = o_stroke.replace("AU", "O")
                     try:
-                        add_to_dict(new_dict, o_stroke, tran)
-                        remove_from_dict(new_dict, stroke, tran)
+                        add_to_dict(dictionary, o_stroke, tran)
+                        remove_from_dict(dictionary, stroke, tran)
                     except ValueError as e:
                         # try and swap prefixes
                         if ("{" in tran and tran not in keep_original_stroke) or tran in force_swap:
                             print("Swapping", e)
-                            new_dict[stroke], new_dict[o_stroke] = new_dict[o_stroke], tran
+                            dictionary[stroke], dictionary[o_stroke] = dictionary[o_stroke], tran
+                            report.count("entries_modified", 2)
                         else:
                             print(e)
 
-    add_to_dict(new_dict, "O*BGT", "October")
-    add_to_dict(new_dict, "SHRAUT", "slaught")
-    add_to_dict(new_dict, "SHRAUTS", "slaughts")
+    add_to_dict(dictionary, "O*BGT", "October")
+    add_to_dict(dictionary, "SHRAUT", "slaught")
+    add_to_dict(dictionary, "SHRAUTS", "slaughts")
+
+    return dictionary
+
+
+PATTERN_ATOR = re.compile("(ator|atur|aiter|ater)s?}?$")
+
+# stroke => (new stroke, translation) to move before anything else
+AEUR_PRE_APPLY = {
+    "HRAR/KWR-T": ("HRAUR/KWR-T", "laureate"),
+    "HRAR/KWR-TS": ("HRAUR/KWR-TS", "laureates"),
+    "HRAR/KWRAEUT": ("HRAUR/KWRAEUT", "laureate"),
+    "HRAR/KWRAEUT/-D": ("HRAUR/KWRAEUT/-D", "laureated"),
+    "HRAR/KWRAEUT/-G": ("HRAUR/KWRAEUT/-G", "laureating"),
+    "HRAR/KWRAEUTS": ("HRAUR/KWRAEUTS", "laureates"),
+    "AEUR/AEURT": ("AEUR/AEURT", "aerator"),
+    "AEUR/AEURTS": ("AEUR/AEURTS", "aerators"),
+    "AEUR/KAEURT": ("AR/KAEURT", "{^aricator}"),
+    "AEUR/KAEURTS": ("AR/KAEURTS", "{^aricators}"),
+    "PREUFB/AEUR/KAEURT": ("PREUFB/AR/KAEURT", "prevaricator"),
+    "PREUFB/AEUR/KAEURTS": ("PREUFB/AR/KAEURTS", "prevaricators"),
+    "TKAOEUFB/AEUR/KAEURT": ("TKAOEUFB/AR/KAEURT", "divaricator"),
+    "TKAOEUFB/AEUR/KAEURTS": ("TKAOEUFB/AR/KAEURTS", "divaricators"),
+    "TPH/TAEUR/TKPWAEURT": ("TPH/TER/TKPWAEURT", "interrogator"),
+    "TPH/TAEUR/TKPWAEURTS": ("TPH/TER/TKPWAEURTS", "interrogators"),
+    "TPHAEUR/AEURT": ("TPHAR/AEURT", "narrator"),
+    "TPHAEUR/AEURTS": ("TPHAR/AEURTS", "narrators"),
+    "HRAEURG": ("HRARPBG", "{laryng^}"),
+}
+
+_AEUR_SURFACE_PARTS = ("AEUR", "A*EUR", "AR", "A*R", "ER", "*ER")
+_AEUR_PRE_APPLY_STROKES = set(AEUR_PRE_APPLY) | {
+    new_stroke for new_stroke, _ in AEUR_PRE_APPLY.values()
+}
+
+
+def in_AEUR_surface(stroke: str, tran: str) -> bool:
+    return stroke in _AEUR_PRE_APPLY_STROKES or any(
+        part in stroke for part in _AEUR_SURFACE_PARTS
+    )
 
-    return new_dict
+
+def plan_AEUR_to_AR_ER(entries: Entries) -> Iterable[str]:
+    return (
+        tran
+        for stroke, tran in entries
+        if not ("AEURT" in stroke and PATTERN_ATOR.search(tran) is not None)
+        and ("ar" in tran or "er" in tran)
+    )
 
 
-def rule_AEUR_to_AR_ER(dictionary: Dict[str, str]) -> Dict[str, str]:
+@needs_pronunciations(plan_AEUR_to_AR_ER)
+@streams(in_AEUR_surface)
+def rule_AEUR_to_AR_ER(
+    dictionary: MutableMapping[str, str], cache: Optional[TieredCache] = None
+) -> MutableMapping[str, str]:
     """e.g.:
     /SPAEUR/OE => /SPAR/OE
     /EBGS/PAEURPLT => /EBGS/PERPLT
     """
-    new_dict: Dict[str, str] = dict(dictionary)
-
-    pre_apply = {
-        "HRAR/KWR-T": ("HRAUR/KWR-T", "laureate"),
-        "HRAR/KWR-TS": ("HRAUR/KWR-TS", "laureates"),
-        "HRAR/KWRAEUT": ("HRAUR/KWRAEUT", "laureate"),
-        "HRAR/KWRAEUT/-D": ("HRAUR/KWRAEUT/-D", "laureated"),
-        "HRAR/KWRAEUT/-G": ("HRAUR/KWRAEUT/-G", "laureating"),
-        "HRAR/KWRAEUTS": ("HRAUR/KWRAEUTS", "laureates"),
-        "AEUR/AEURT": ("AEUR/AEURT", "aerator"),
-        "AEUR/AEURTS": ("AEUR/AEURTS", "aerators"),
-        "AEUR/KAEURT": ("AR/KAEURT", "{^aricator}"),
-        "AEUR/KAEURTS": ("AR/KAEURTS", "{^aricators}"),
-        "PREUFB/AEUR/KAEURT": ("PREUFB/AR/KAEURT", "prevaricator"),
-        "PREUFB/AEUR/KAEURTS": ("PREUFB/AR/KAEURTS", "prevaricators"),
-        "TKAOEUFB/AEUR/KAEURT": ("TKAOEUFB/AR/KAEURT", "divaricator"),
-        "TKAOEUFB/AEUR/KAEURTS": ("TKAOEUFB/AR/KAEURTS", "divaricators"),
-        "TPH/TAEUR/TKPWAEURT": ("TPH/TER/TKPWAEURT", "interrogator"),
-        "TPH/TAEUR/TKPWAEURTS": ("TPH/TER/TKPWAEURTS", "interrogators"),
-        "TPHAEUR/AEURT": ("TPHAR/AEURT", "narrator"),
-        "TPHAEUR/AEURTS": ("TPHAR/AEURTS", "narrators"),
-        "HRAEURG": ("HRARPBG", "{laryng^}"),
-    }
+    # the entries as they were, since the rule changes the dictionary in place
+    entries = list(dictionary.items())
 
-    for stroke in pre_apply:
-        new_stroke, tran = pre_apply[stroke]
-        add_to_dict(new_dict, new_stroke, tran)
-        remove_from_dict(new_dict, stroke, tran)
+    for stroke in AEUR_PRE_APPLY:
+        new_stroke, tran = AEUR_PRE_APPLY[stroke]
+        add_to_dict(dictionary, new_stroke, tran)
+        remove_from_dict(dictionary, stroke, tran)
 
     force_translate_parts = {
         "lariat",
@@ -257,18 +725,16 @@ def rule_AEUR_to_AR_ER(dictionary: Dict[str, str]) -> Dict[str, str]:
         "Bering",
     }
 
-    pattern_ator = re.compile("(ator|atur|aiter|ater)s?}?$")
-
-    with dbm.open("ipa_cache", "c") as cache:
-        for stroke, tran in dictionary.items():
+    with open_cache(cache) as cache:
+        for stroke, tran in entries:
             # AEURT ~= "^ator" and should be ignored, these are the exceptions
-            if "AEURT" in stroke and pattern_ator.search(tran) is not None:
+            if "AEURT" in stroke and PATTERN_ATOR.search(tran) is not None:
                 continue
 
             if "AEUR" or "A*EUR" in stroke:
                 new_stroke = stroke
                 if "ar" in tran:
-                    pronunciation = ipa.word_to_ipa(tran, cache=cache)
+                    pronunciation = ipa.word_to_ipa(tran, cache=cache.pronunciations)
                     if "eə" not in pronunciation or any(
                         part in tran for part in force_translate_parts
                     ):
@@ -276,7 +742,7 @@ def rule_AEUR_to_AR_ER(dictionary: Dict[str, str]) -> Dict[str, str]:
                         new_stroke = new_stroke.replace("A*EUR", "A*R")
 
                 if "er" in tran:
-                    pronunciation = ipa.word_to_ipa(tran, cache=cache)
+                    pronunciation = ipa.word_to_ipa(tran, cache=cache.pronunciations)
                     if "eə" not in pronunciation or any(
                         part in tran for part in force_translate_parts
                     ):
@@ -284,76 +750,81 @@ def rule_AEUR_to_AR_ER(dictionary: Dict[str, str]) -> Dict[str, str]:
                         new_stroke = new_stroke.replace("A*EUR", "*ER")
 
                 try:
-                    add_to_dict(new_dict, new_stroke, tran)
+                    add_to_dict(dictionary, new_stroke, tran)
                 except ValueError as e:
                     print(e)
                     if tran in ("marry", "{var^}", "parody"):
                         print("Swapping", e)
-                        new_dict[stroke], new_dict[new_stroke] = new_dict[new_stroke], tran
+                        dictionary[stroke], dictionary[new_stroke] = dictionary[new_stroke], tran
+                        report.count("entries_modified", 2)
 
-    return new_dict
+    return dictionary
 
 
-def rule_punctuation(dictionary: Dict[str, str]) -> Dict[str, str]:
+@streams(lambda stroke, tran: "} " in tran)
+def rule_punctuation(dictionary: MutableMapping[str, str]) -> MutableMapping[str, str]:
     """Change punctuation to the way I prefer it.
     """
-    new_dict: Dict[str, str] = dict(dictionary)
-
     period_stroke = re.compile(fr"{START_OF_STROKE}PH-PL{END_OF_STROKE}")
 
     # remove unnecessary space
-    for stroke, tran in new_dict.items():
-        new_dict[stroke] = tran.replace("} ", "}")
+    for stroke, tran in dictionary.items():
+        set_in_dict(dictionary, stroke, tran.replace("} ", "}"))
 
-    return new_dict
+    return dictionary
 
 
-def rule_been(dictionary: Dict[str, str]) -> Dict[str, str]:
+@streams(lambda stroke, tran: stroke in ("PWAOEPB", "PWAEPB", "PWEUPB", "PW*EUPB"))
+def rule_been(dictionary: MutableMapping[str, str]) -> MutableMapping[str, str]:
     """Change been/bean/bin
     """
-    dictionary["PWAOEPB"] = "been"
-    dictionary["PWAEPB"] = "bean"
-    dictionary["PWEUPB"] = "bin"
+    set_in_dict(dictionary, "PWAOEPB", "been")
+    set_in_dict(dictionary, "PWAEPB", "bean")
+    set_in_dict(dictionary, "PWEUPB", "bin")
     del dictionary["PW*EUPB"]
+    report.count("entries_removed")
 
     return dictionary
 
 
-def rule_number_star(dictionary: Dict[str, str]) -> Dict[str, str]:
+NUMBER_PATTERN = re.compile(r"[0-9]+(st|nd|rd|th)?s?")
+
+
+@streams(lambda stroke, tran: "*" in stroke or NUMBER_PATTERN.fullmatch(tran) is not None)
+def rule_number_star(dictionary: MutableMapping[str, str]) -> MutableMapping[str, str]:
     """Swap all entries with numbers with an identical non-star number.
     """
     add_to_dict(dictionary, "KWA*EPBGTS", "eighteenths")
 
-    numbers = re.compile(r"[0-9]+(st|nd|rd|th)?s?")
-
     do_not_swap = ["OERBGS"]
 
     to_swap = []
 
     for stroke, tran in dictionary.items():
-        if numbers.fullmatch(tran) and not any(digit in stroke for digit in string.digits):
+        if NUMBER_PATTERN.fullmatch(tran) and not any(digit in stroke for digit in string.digits):
             strokes = [S(s) for s in stroke.split("/")]
-            if "*" in strokes[0].keys:
+            if "*" in strokes[0]:
                 continue
 
-            with_star = strokes[0]
-            with_star.keys.add("*")
+            strokes[0] += S("*")
 
             stroke_with_star = "/".join(str(s) for s in strokes)
-            try:
-                print(stroke, tran)
-                print(stroke_with_star, dictionary[str(stroke_with_star)])
-                to_swap.append((stroke, stroke_with_star))
-            except KeyError as e:
-                print("No corresponding entry", e)
+            print(stroke, tran)
+            if stroke_with_star not in dictionary:
+                print("No corresponding entry", repr(stroke_with_star))
+                continue
+            print(stroke_with_star, dictionary[stroke_with_star])
+            to_swap.append((stroke, stroke_with_star))
 
     for stroke, stroke_with_star in to_swap:
         dictionary[stroke], dictionary[stroke_with_star] = dictionary[stroke_with_star], dictionary[stroke]
+        report.count("entries_modified", 2)
 
     return dictionary
 
 
-def rule_TH_the(dictionary: Dict[str, str]) -> Dict[str, str]:
+@streams(lambda stroke, tran: "TH" in stroke or "-T" in stroke)
+def rule_TH_the(dictionary: MutableMapping[str, str]) -> MutableMapping[str, str]:
     """Replace all /-T for "the" with /TH as per Philadelphia Clinic,
     Phoenix styles.
 
@@ -364,67 +835,128 @@ def rule_TH_the(dictionary: Dict[str, str]) -> Dict[str, str]:
     for stroke, tran in delete_entries.items():
         remove_from_dict(dictionary, stroke, tran)
 
-    new_dict: Dict[str, str] = dict()
+    dictionary = indexed(dictionary)
 
     think_stroke = re.compile(fr"{START_OF_STROKE}THEU")
 
     sub_pattern = re.compile(fr"{START_OF_STROKE}-T{END_OF_STROKE}")
     the_pattern = re.compile(fr"\bthe\b")
 
-    for stroke, tran in dictionary.items():
+    candidates = [
+        (stroke, dictionary[stroke]) for stroke in dictionary.candidates(S("-T"), S("THEU"))
+    ]
+    for stroke, tran in candidates:
         if think_stroke.search(stroke) is not None and "think" in tran:
             # delete entry
+            del dictionary[stroke]
+            report.count("entries_removed")
             continue
 
+        new_stroke = stroke
         if the_pattern.search(tran) is not None:
-            stroke = sub_pattern.sub(r"\1TH\2", stroke)
-        add_to_dict(new_dict, stroke, tran)
+            new_stroke = sub_pattern.sub(r"\1TH\2", stroke)
+        rename_in_dict(dictionary, stroke, new_stroke, tran)
 
-    add_to_dict(new_dict, "THEUS", "this")
+    add_to_dict(dictionary, "THEUS", "this")
 
-    return new_dict
+    return dictionary
 
 
-def rule_FR_for(dictionary: Dict[str, str]) -> Dict[str, str]:
+FR_DELETE_ENTRIES = {
+    "TPR": "from",
+    "TPR-S": "{^s from}",
+    "TPR-T": "from the",
+    "TPR-Z": "{^s} from",
+    "KOPL/-BG/TPR": "coming from",
+}
+
+
+@streams(lambda stroke, tran: stroke in FR_DELETE_ENTRIES or stroke == "TPROPLT")
+def rule_FR_for(dictionary: MutableMapping[str, str]) -> MutableMapping[str, str]:
     """Move "for" to /FR- and change /FR.. entries to use "for" instead of
     "from".
 
     Adds /FROMT for "from the".
     """
-    new_dict = dict(dictionary)
-
-    delete_entries = {
-        "TPR": "from",
-        "TPR-S": "{^s from}",
-        "TPR-T": "from the",
-        "TPR-Z": "{^s} from",
-        "KOPL/-BG/TPR": "coming from",
-    }
-
-    for k, v in delete_entries.items():
-        remove_from_dict(new_dict, k, v)
+    for k, v in FR_DELETE_ENTRIES.items():
+        remove_from_dict(dictionary, k, v)
 
-    add_to_dict(new_dict, "TPR", "for")
-    add_to_dict(new_dict, "TPR-T", "for the")
-    add_to_dict(new_dict, "TPROPLT", "from the")
+    add_to_dict(dictionary, "TPR", "for")
+    add_to_dict(dictionary, "TPR-T", "for the")
+    add_to_dict(dictionary, "TPROPLT", "from the")
 
-    return new_dict
+    return dictionary
 
 
-def rule_PLT_consistency(dictionary: Dict[str, str]) -> Dict[str, str]:
+@streams(lambda stroke, tran: "PLT" in stroke)
+def rule_PLT_consistency(dictionary: MutableMapping[str, str]) -> MutableMapping[str, str]:
     """Change all /*PLT strokes to be just /-PLT.
     """
-    new_dict: Dict[str, str] = dict()
+    dictionary = indexed(dictionary)
 
     pat = re.compile(fr"{START_OF_STROKE}\*PLT{END_OF_STROKE}")
-    for stroke, tran in dictionary.items():
+    candidates = [(stroke, dictionary[stroke]) for stroke in dictionary.candidates(S("*PLT"))]
+    for stroke, tran in candidates:
         new_stroke = pat.sub(r"\1-PLT\2", stroke)
-        add_to_dict(new_dict, new_stroke, tran)
+        rename_in_dict(dictionary, stroke, new_stroke, tran)
 
-    return new_dict
+    return dictionary
 
 
-def rule_vop_shortvowels(dictionary: Dict[str, str]) -> Dict[str, str]:
+# note that the RHS consonant is necessary, while left is optional
+_LEFT_CONSONANTS = r"(?P<left>[STKPWHR]*)"
+_RIGHT_CONSONANTS = r"(?P<right>[FRPBLGTSDZ]+)"
+_SHORTVOWEL = r"(?P<vowels>A\*|O\*|\*E|\*U|\*EU|A|O|E|U|EU)"
+
+# note that it must be at least the second stroke
+SHORTVOWEL_PATTERN = re.compile(
+    fr"/{_LEFT_CONSONANTS}{_SHORTVOWEL}{_RIGHT_CONSONANTS}{END_OF_STROKE}"
+)
+_LOWERCASE_TRAN_PATTERN = re.compile(r"[a-z]+")
+_ANY_DIGIT_PATTERN = re.compile(r"[0-9]")
+
+
+def is_vop_candidate(stroke: str, tran: str) -> bool:
+    """
+    >>> is_vop_candidate("PHAPBLG/EUBG", "magic")
+    True
+    >>> is_vop_candidate("PHAPBLG/EUBG", "Magic")
+    False
+    """
+    # ignore multi-words, capital names, compound-hyphenated-words
+    if (
+        not _LOWERCASE_TRAN_PATTERN.fullmatch(tran)
+        or "#" in stroke
+        or _ANY_DIGIT_PATTERN.search(stroke) is not None
+    ):
+        return False  # TODO add to dict
+
+    # # ignore extremely long strokes
+    # if tran.count("/") > 3:
+    #     return False
+
+    return SHORTVOWEL_PATTERN.search(stroke) is not None
+
+
+def plan_vop_shortvowels(entries: Entries) -> Iterable[str]:
+    return (tran for stroke, tran in entries if is_vop_candidate(stroke, tran))
+
+
+@needs_pronunciations(plan_vop_shortvowels)
+@parallel
+@entrywise
+@aligns
+@streams(
+    lambda stroke, tran: stroke in ("-R", "-S") or is_vop_candidate(stroke, tran),
+    keep_others=False,
+)
+def rule_vop_shortvowels(
+    dictionary: MutableMapping[str, str],
+    cache: Optional[TieredCache] = None,
+    jobs: int = 1,
+    outputs: Optional[EntryOutputs] = None,
+    table: Optional[PhonemeTable] = None,
+) -> MutableMapping[str, str]:
     """Changes dictionary entries to remove short unstressed vowels from
     appended strokes with short vowels.
 
@@ -438,47 +970,62 @@ def rule_vop_shortvowels(dictionary: Dict[str, str]) -> Dict[str, str]:
     /ET => /-T
     /MAL => /M-L
     etc.
+
+    The vowels are reduced in ``jobs`` processes; the entries are still added
+    in dictionary order, so conflicts are reported as in a serial run.  The
+    strokes reduced last time are taken from ``outputs``, where given.
+    Strokes are aligned with ``table``, by default the current theory.
     """
+    dictionary = indexed(dictionary)
+
+    # only the reduced entries are kept
+    report.count("entries_removed", len(dictionary))
     del dictionary["-R"]  # = "are"
     del dictionary["-S"]  # = "{^s}"
 
-    new_dict: Dict[str, str] = dict()
-
-    # note that the RHS consonant is necessary, while left is optional
-    left_consonants = r"(?P<left>[STKPWHR]*)"
-    right_consonants = r"(?P<right>[FRPBLGTSDZ]+)"
-    shortvowel = r"(?P<vowels>A\*|O\*|\*E|\*U|\*EU|A|O|E|U|EU)"
+    new_dict = StenoDictionary()
 
-    # note that it must be at least the second stroke
-    shortvowel_pattern = re.compile(
-        fr"/{left_consonants}{shortvowel}{right_consonants}{END_OF_STROKE}"
-    )
-    lowercase_tran_pattern = re.compile(r"[a-z]+")
-    any_digit_pattern = re.compile(r"[0-9]")
-
-    with dbm.open("ipa_cache", "c") as cache:
-        for stroke, tran in dictionary.items():
-            # ignore multi-words, capital names, compound-hyphenated-words
-            if (
-                not lowercase_tran_pattern.fullmatch(tran)
-                or "#" in stroke
-                or any_digit_pattern.search(stroke) is not None
-            ):
-                continue  # TODO add to dict
+    # a short vowel in any stroke but the first
+    candidates = [
+        (stroke, dictionary[stroke])
+        for stroke in dictionary.candidates(S("A"), S("O"), S("E"), S("U"), start=1)
+        if is_vop_candidate(stroke, dictionary[stroke])
+    ]
 
-            # # ignore extremely long strokes
-            # if tran.count("/") > 3:
-            #     continue
+    if outputs is None:
+        outputs = EntryOutputs()
+
+    with open_cache(cache) as cache:
+        # the reduced stroke depends on the pronunciation too
+        pronunciations = [
+            ipa.word_to_ipa(tran, cache=cache.pronunciations) for _, tran in candidates
+        ]
+        reduced_strokes: List[Optional[str]] = [
+            outputs.get(stroke, tran, pronunciation)
+            for (stroke, tran), pronunciation in zip(candidates, pronunciations)
+        ]
+        todo = [ix for ix, reduced in enumerate(reduced_strokes) if reduced is None]
+        report.count("entries_reused", len(candidates) - len(todo))
+
+        # DO THE THING
+        reduced = apply_vop_many(
+            [candidates[ix] for ix in todo],
+            cache,
+            jobs=jobs,
+            table=table,
+            pronunciations=[pronunciations[ix] for ix in todo],
+        )
+    for ix, result in zip(todo, reduced):
+        reduced_strokes[ix] = result
+        outputs.put(*candidates[ix], result, pronunciations[ix])
 
-            if shortvowel_pattern.search(stroke) is not None:
-                # DO THE THING
-                reduced_stroke = apply_vop(stroke, tran, cache)
-                if reduced_stroke:
-                    print(stroke, tran, reduced_stroke)
-                    try:
-                        add_to_dict(new_dict, reduced_stroke, tran)
-                    except ValueError as e:
-                        print(e)
+    for (stroke, tran), reduced_stroke in zip(candidates, reduced_strokes):
+        if reduced_stroke:
+            print(stroke, tran, reduced_stroke)
+            try:
+                add_to_dict(new_dict, reduced_stroke, tran)
+            except ValueError as e:
+                print(e)
 
     add_to_dict(new_dict, "-R", "{^er}")
     add_to_dict(new_dict, "-S", "{^us}")
@@ -486,19 +1033,161 @@ def rule_vop_shortvowels(dictionary: Dict[str, str]) -> Dict[str, str]:
     return new_dict
 
 
-def process_all() -> None:
-    dictionary = json.loads(DICTIONARY.read_text())
+def process_all(
+    streaming: bool = False,
+    jobs: Optional[int] = None,
+    incremental: bool = False,
+    resume_from: int = 0,
+    export_json: bool = True,
+    pronunciations: Optional[Path] = None,
+    theory: Union[str, Path, None] = None,
+) -> None:
+    """Applies every rule in turn, checkpointing each stage to
+    ``stage_{ix}.pickle`` and, with ``export_json``, ``stage_{ix}_dict.json``.
+
+    With ``resume_from``, the stages before it are not run again if they have
+    a checkpoint made from the same source by the same rules.
+
+    With ``streaming``, the rules are chained as :func:`stream_rule` stages
+    instead, and only the final stage is written.  ``incremental`` streams
+    too, reusing whatever the previous run recorded in the dictionary's
+    manifest.  Lookups and parallel rules use ``jobs`` workers, by default one
+    per CPU.
+
+    Words in the ``pronunciations`` file (see :meth:`ipa.TableBackend.from_file`)
+    are pronounced from it; espeak is only run for the rest, if it is
+    installed.
+
+    Strokes are aligned to pronunciations with ``theory``, the name of one of
+    ``stroke.THEORIES`` or a file for :meth:`stroke.PhonemeTable.from_file`,
+    by default the theory of the dictionary.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if resume_from and (streaming or incremental):
+        raise ValueError("Only a staged run can resume from a checkpoint")
 
     if "phoenix" in DICTIONARY.name:
         steps = [rule_AULT_ALT, rule_AU_O, rule_AEUR_to_AR_ER, rule_been, rule_punctuation, rule_number_star]
     else:
         steps = [rule_TH_the, rule_FR_for, rule_PLT_consistency, rule_vop_shortvowels]
 
+    if theory is None:
+        theory = "phoenix" if "phoenix" in DICTIONARY.name else "plover"
+    if isinstance(theory, Path):
+        table = PhonemeTable.from_file(theory)
+    else:
+        table = THEORIES[theory]
+
+    # restored afterwards, so that the table only applies to this run
+    backend = ipa.current_backend()
+    if pronunciations is not None:
+        known = ipa.TableBackend.from_file(pronunciations)
+        # words in neither are left unpronounced if espeak is not installed
+        ipa.set_backend(ipa.ChainBackend(known, ipa.EspeakBackend(missing_ok=True)))
+    try:
+        _process(
+            steps, table, pronunciations, streaming, jobs, incremental, resume_from, export_json
+        )
+    finally:
+        ipa.set_backend(backend)
+
+
+def _process(
+    steps,
+    table: PhonemeTable,
+    pronunciations: Optional[Path],
+    streaming: bool,
+    jobs: int,
+    incremental: bool,
+    resume_from: int,
+    export_json: bool,
+) -> None:
+    mode = "incremental" if incremental else "streaming" if streaming else "staged"
+    run_report = RunReport(dictionary=DICTIONARY.name, mode=mode, jobs=jobs)
+
+    with TieredCache.open("ipa_cache") as cache:
+        if streaming or incremental:
+            process_streaming(steps, cache, jobs, incremental, run_report, table)
+            run_report.save(Path("run_report.json"))
+            return
+
+        # the theory and the pronunciations are part of the source, since the
+        # rules depend on them
+        heard = checkpoint.file_digest(pronunciations) if pronunciations else ""
+        chain = checkpoint.chain_digests(
+            f"{checkpoint.file_digest(DICTIONARY)}:{table.digest}:{heard}",
+            steps,
+            code=source_digest(RULE_SOURCES),
+        )
+        start, resumed = checkpoint.resume(chain, resume_from)
+        # built once, and changed in place by each rule in turn
+        dictionary: MutableMapping[str, str]
+        if resumed is not None:
+            print(f"Resuming from stage {start}")
+            dictionary = indexed(resumed)
+        else:
+            dictionary = StenoDictionary(read_entries(DICTIONARY))
+
+        with run_report.measure("prefetch_pronunciations"):
+            prefetch_pronunciations(steps[start:], dictionary, cache, jobs=jobs)
+
+        for ix, transform in enumerate(steps[start:], start):
+            dictionary = run_rule(
+                transform, dictionary, cache, jobs, run_report, table=table
+            )
+            checkpoint.save(checkpoint.checkpoint_path(ix), dictionary, chain[ix])
+            if export_json:
+                write_sorted(Path(f"stage_{ix}_dict.json"), dictionary.items())
+
+    run_report.save(Path("run_report.json"))
+
+
+def process_streaming(
+    steps,
+    cache: TieredCache,
+    jobs: int = 1,
+    incremental: bool = False,
+    run_report: Optional[RunReport] = None,
+    table: Optional[PhonemeTable] = None,
+) -> None:
+    """Chains ``steps`` as :func:`stream_rule` stages over ``DICTIONARY``,
+    which is read as it is needed, and writes the final stage.  Strokes are
+    aligned with ``table``, by default the current theory.
+    """
+    if table is None:
+        table = current_theory()
+    source = JSONDictionary(DICTIONARY)
+    if run_report is None:
+        run_report = RunReport()
+    with run_report.measure("prefetch_pronunciations"):
+        prefetch_pronunciations(steps, source, cache, jobs=jobs)
+
+    manifest: Optional[Manifest] = None
+    if incremental:
+        manifest = Manifest.load(
+            Path(f"{DICTIONARY.stem}.manifest"),
+            f"{source_digest(RULE_SOURCES)}:{table.digest}",
+        )
+        changed = manifest.record_entries(source.items())
+        print(f"{changed} new or changed entries")
+
+    entries: Entries = source.items()
     for ix, transform in enumerate(steps):
-        dictionary = transform(dictionary)
-        Path(f"stage_{ix}_dict.json").write_text(
-            json.dumps(dictionary, indent=0, ensure_ascii=False, sort_keys=True)
+        entries = stream_rule(
+            transform,
+            entries,
+            cache=cache,
+            jobs=jobs,
+            manifest=manifest,
+            stage=f"{ix}:{transform.__name__}",
+            run_report=run_report,
+            table=table,
         )
+    write_sorted(Path(f"stage_{len(steps) - 1}_dict.json"), entries)
+
+    if manifest is not None:
+        manifest.save()
 
 
 if __name__ == "__main__":